@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""flocking -- the Boids behavior tree, independent of any display.
+
+L{Flocking} holds the behavior tree and the behaviors of a member of a
+flock, in terms of plain C{x}, C{y}, C{rotation} and C{speed}
+attributes. Concrete boids mix it in with something that provides
+those attributes and implements L{Flocking.findNeighbors}: see
+L{boids.Boid<examples.boids.Boid>} for a cocos2d sprite, and
+L{headless.HeadlessBoid<examples.headless.HeadlessBoid>} for one that
+needs no graphics libraries at all.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+
+@newfield blackboard: Blackboard data
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+from math import radians, degrees, sin, cos, pi
+pi_1_2 = pi/2.0
+
+### Optimized attribute getters for sprites..
+from operator import attrgetter
+getX = attrgetter('x')
+getY = attrgetter('y')
+getR = attrgetter('rotation')
+
+### Memojito provides memoization (caching) services.
+import memojito
+
+## Owyl provides the wisdom
+import owyl
+from owyl.flyweight import shared
+
+from steering import Steering
+
+
+class Flocking(Steering):
+    """Implement the behavior of a member of a flock.
+
+    The behaviors are implemented as methods, using the
+    L{owyl.agentmethod} decorator, and the tree is built in the
+    L{Flocking.buildTree} method, below. Subclasses must provide a
+    class-level C{boids} list of the flock, and implement
+    L{findNeighbors}.
+
+    The tree is built once per class, and shared by the whole flock:
+    each boid runs it with itself as the C{agent} keyword argument.
+    """
+    @classmethod
+    @shared
+    def buildTree(cls):
+        """Build the behavior tree.
+
+        Building the behavior tree is as simple as nesting the
+        behavior constructor calls.
+
+        Building the Behavior Tree
+        ==========================
+
+         We'll use a L{parallel<owyl.core.parallel>} parent node as
+         the root of our tree. Parallel is essentially a round-robin
+         scheduler. That is, each time it runs, it will run each of its
+         children in turn until that child stalls, so that the
+         children execute parallel to each other. Parallel is useful
+         as a root behavior when we want multiple behaviors to run at
+         the same time, as with Boids.
+
+         The first call to a task node constructor returns another
+         function. Calling I{that} function will return an iterable
+         generator. (This behavior is provided by the "@task..."
+         family of python decorators found in L{owyl.core}.)
+         Generally, you won't have to worry about this unless you're
+         writing new parent nodes, but keep it in mind.
+
+         Also note that keyword arguments can be provided at
+         construction time (call to task constructor) or at run-time
+         (call to visit). The C{blackboard} keyword argument to
+         C{visit} will be available to the entire tree. (This is also
+         why all nodes should accept C{**kwargs}-style keyword
+         arguments, and access.
+
+         The finished tree is returned to the caller, which runs it
+         with L{visit<owyl.core.visit>} (or hands it to a
+         L{TreeScheduler<owyl.scheduler.TreeScheduler>}, which visits
+         it for us). L{visit<owyl.core.visit>} provides
+         the external iterator interface to the tree. Technically,
+         it's an implementation of the Visitor pattern. It visits each
+         "node" of the behavior tree and iterates over it, descending
+         into children as determined by the logic of the parent
+         nodes. (In AI terminology, this is a depth-first search, but
+         with the search logic embedded in the tree.)
+         L{visit<owyl.core.visit>} is also used internally by several
+         parent behaviors, including L{parallel<owyl.core.parallel>},
+         L{limit<owyl.decorators.limit>}, and
+         L{repeatAlways<owyl.decorators.repeatAlways>} in order to
+         gain more control over its children.
+
+        L{limit<owyl.decorators.limit>}
+        ===============================
+
+         The next parent node we see is
+         L{limit<owyl.decorators.limit>}. L{limit<owyl.decorators.limit>}
+         is a decorator node designed to limit how often its child is
+         run (given by the keyword argument C{limit_period} in
+         seconds). This is useful for limiting the execution of
+         expensive tasks.
+
+         In the example below, we're using
+         L{limit<owyl.decorators.limit>} to clear memoes once every
+         0.4 seconds. This implementation of Boids uses
+         L{memojito<examples.memojito>} to cache (or "memoize")
+         neighbor data for each Boid. Neighbor data is used by each of
+         the core behaviors, and is fairly expensive to
+         calculate. However, it's constantly changing, so adjusting
+         the limit_period will affect the behavior of the flock (and
+         the frame rate).
+
+        L{repeatAlways<owyl.decorators.repeatAlways>}
+        =============================================
+
+         We next see the L{repeatAlways<owyl.decorators.repeatAlways>}
+         decorator node. This does exactly as you might expect: it
+         takes a behavior that might only run once, and repeats it
+         perpetually, ignoring return values and always yielding None
+         (the special code for "I'm not done yet, give me another
+         chance to run").
+
+        L{sequence<owyl.decorators.sequence>}
+        =============================================
+
+         Runs a sequence of actions. If any action yields False,
+         then the rest of the sequence is not executed (the sequence
+         is halted).  Otherwise, the next sequence item is run.  In
+         this example, a boid accelerates away only if it is too close
+         to another boid.
+
+        Core Behaviors
+        ==============
+
+         The core behaviors are documented below in each method's
+         docstring. They are:
+
+          - L{Flocking.hasCloseNeighbors}: conditional to detect crowding
+          - L{Flocking.accelerate}: accelerate at a given rate
+          - L{Flocking.matchSpeed}: accelerate to match a given speed
+          - L{Flocking.move}: move straight ahead at current speed
+          - L{Flocking.seek}: seek a fixed goal position
+          - L{Flocking.steerToMatchHeading}: match neighbors' average
+            heading
+          - L{Flocking.steerForSeparation}: steer away from close
+            flockmates
+          - L{Flocking.steerForCohesion}: steer toward average position of
+            neighbors.
+
+        """
+        tree = owyl.parallel(
+            owyl.limit(
+                owyl.repeatAlways(cls.clearMemoes(), debug=True),
+                limit_period=0.4),
+
+            ### Velocity and Acceleration
+            #############################
+            owyl.repeatAlways(owyl.sequence(cls.hasCloseNeighbors(),
+                                            cls.accelerate(rate=-.01),
+                                            ),
+                              ),
+            cls.move(),
+            cls.matchSpeed(match_speed=300, rate=.01),
+
+            ### Steering
+            ############
+            cls.seek(goal=(0, 0), rate=5),
+            cls.steerToMatchHeading(rate=2),
+            cls.steerForSeparation(rate=5),
+            cls.steerForCohesion(rate=2),
+
+            policy=owyl.PARALLEL_SUCCESS.REQUIRE_ALL
+            )
+        return tree
+
+    @owyl.agentmethod
+    def hasCloseNeighbors(self, **kwargs):
+        """Check to see if we have close neighbors.
+        """
+        yield bool(self.closest_neighbors)
+
+    @owyl.agentmethod
+    def accelerate(self, **kwargs):
+        """accelerate
+
+        @keyword rate: The rate of acceleration (+ or -)
+        """
+        bb = kwargs['blackboard']
+        rate = kwargs['rate']
+        dt = bb['dt']
+        self.speed = max(self.speed + rate * dt, 0)
+        yield True
+
+    @owyl.agentmethod
+    def matchSpeed(self, **kwargs):
+        """Accelerate to match the given speed.
+
+        @keyword blackboard: A shared blackboard.
+        @keyword match_speed: The speed to match.
+        @keyword rate: The rate of acceleration.
+        """
+        bb = kwargs['blackboard']
+        ms = kwargs['match_speed']
+        rate = kwargs['rate']
+        while True:
+            if self.speed == ms:
+                yield None
+            dt = bb['dt']
+            dv_size = ms - self.speed
+            dv = dv_size * rate * dt
+            self.speed += dv
+            yield None
+
+    @owyl.agentmethod
+    def move(self, **kwargs):
+        """Move the actor forward perpetually.
+
+        @keyword blackboard: shared blackboard
+
+        @blackboard: B{dt}: time elapsed since last update.
+        """
+        bb = kwargs['blackboard']
+        while True:
+            dt = bb['dt']
+            r = radians(getR(self)) # rotation
+            s = dt * self.speed
+            self.x += sin(r) * s
+            self.y += cos(r) * s
+            yield None
+
+
+    @owyl.agentmethod
+    def seek(self, **kwargs):
+        """Perpetually seek a goal position.
+
+        @keyword rate: steering rate
+        @keyword blackboard: shared blackboard
+
+        @blackboard: B{dt}: time elapsed since last update.
+        """
+        bb = kwargs['blackboard']
+        rate = kwargs['rate']
+        gx, gy = kwargs.get('goal', (0, 0))
+        while True:
+            dt = bb['dt']
+            dx = gx-self.x
+            dy = gy-self.y
+            seek_heading = self.getFacing(dx, dy)
+            my_heading = radians(self.rotation)
+
+            rsize = degrees(self.findRotationDelta(my_heading, seek_heading))
+
+            rchange = rsize * rate * dt
+            self.rotation += rchange
+            yield None
+
+
+    @owyl.agentmethod
+    def steerToMatchHeading(self, **kwargs):
+        """Perpetually steer to match actor's heading to neighbors.
+
+        @keyword blackboard: shared blackboard
+        @keyword rate: steering rate
+
+        @blackboard: B{dt}: time elapsed since last update.
+        """
+        bb = kwargs['blackboard']
+        rate = kwargs['rate']
+        while True:
+            dt = bb['dt'] or 0.01
+            n_heading = radians(self.findAverageHeading(*self.neighbors))
+            if n_heading is None:
+                yield None
+                continue
+            my_heading = radians(self.rotation)
+
+            rsize = degrees(self.findRotationDelta(my_heading, n_heading))
+
+            # Factor in our turning rate and elapsed time.
+            rchange = rsize * rate * dt
+
+            self.rotation += rchange
+            yield None
+
+    @owyl.agentmethod
+    def steerForSeparation(self, **kwargs):
+        """Steer to maintain distance between self and neighbors.
+
+        @keyword blackboard: shared blackboard
+        @keyword rate: steering rate
+
+        @blackboard: B{dt}: time elapsed since last update.
+        """
+        bb = kwargs['blackboard']
+        rate = kwargs['rate']
+        while True:
+            cn_x, cn_y = self.findAveragePosition(*self.closest_neighbors)
+
+            dt = bb['dt']
+            dx = self.x-cn_x
+            dy = self.y-cn_y
+
+            heading_away_from_neighbors = self.getFacing(dx, dy)
+            flee_heading = heading_away_from_neighbors
+            my_heading = radians(self.rotation)
+
+            rsize = degrees(self.findRotationDelta(my_heading, flee_heading))
+
+            # Factor in our turning rate and elapsed time.
+            rchange = rsize * rate * dt
+
+            self.rotation += rchange
+            yield None
+
+    @owyl.agentmethod
+    def steerForCohesion(self, **kwargs):
+        """Steer toward the average position of neighbors.
+
+        @keyword blackboard: shared blackboard
+        @keyword rate: steering rate
+
+        @blackboard: B{dt}: time elapsed since last update.
+        """
+        bb = kwargs['blackboard']
+        rate = kwargs['rate']
+        while True:
+            neighbors = self.neighbors
+            np_x, np_y = self.findAveragePosition(*neighbors)
+            dt = bb['dt']
+            dx = np_x-self.x
+            dy = np_y-self.y
+            seek_heading = self.getFacing(dx, dy)
+            my_heading = radians(self.rotation)
+
+            # Find the rotation delta
+            rsize = degrees(self.findRotationDelta(my_heading, seek_heading))
+
+            # Factor in our turning rate and elapsed time.
+            rchange = rsize * rate * dt
+
+            self.rotation += rchange
+            yield None
+
+
+
+    def canSee(self, other):
+        """Return True if I can see the other boid.
+
+        @param other: Another boid.
+        @type other: L{Flocking}
+        """
+        dx = self.x - other.x
+        dy = self.y - other.y
+        return abs(self.getFacing(dx, dy)) < pi_1_2
+
+    @memojito.memoizedproperty
+    def others(self):
+        """Find other boids that I can see.
+
+        @rtype: C{list} of L{Flocking}s.
+        """
+        return [b for b in self.boids if b is not self and self.canSee(b)]
+
+    @property
+    def neighbors(self):
+        """Find the other boids in my neighborhood.
+
+        @rtype: C{list} of L{Flocking}s.
+        """
+        return self.findNeighbors(self.neighborhood_radius)
+
+    @property
+    def closest_neighbors(self):
+        """Find the closest neighbors.
+
+        @rtype: C{list} of L{Flocking}s.
+        """
+        return self.findNeighbors(self.personal_radius)
+
+    def findNeighbors(self, radius):
+        """Find the other boids I can see within the given radius.
+
+        Subclasses implement this with whatever collision detection
+        they have at hand.
+
+        @rtype: C{list} of L{Flocking}s.
+        """
+        raise NotImplementedError
+
+    def findAveragePosition(self, *boids):
+        """Return the average position of the given boids.
+
+        @rtype: C{tuple} of C{(x, y)}.
+        """
+        if not boids:
+            return (0, 0)
+        num_n = float(len(boids)) or 1
+        avg_x = sum((getX(n) for n in boids))/num_n
+        avg_y = sum((getY(n) for n in boids))/num_n
+        return avg_x, avg_y
+
+    def findAverageHeading(self, *boids):
+        """Return the average heading of the given boids.
+
+        @rtype: C{float} rotation in degrees.
+        """
+        if not boids:
+            return 0.0
+        return sum((getR(b) for b in boids))/len(boids)
+
+    @owyl.agentmethod
+    def clearMemoes(self, **kwargs):
+        """Clear memoizations.
+        """
+        self.clear()
+        yield True
+
+    @memojito.clearbefore
+    def clear(self):
+        """Clear memoizations.
+        """
+        pass
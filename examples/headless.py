@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""headless -- run the Boids example without a display.
+
+This runs the same behavior tree as L{boids<examples.boids>}, but
+with boids that are plain objects with a position and a rotation, and
+with neighbor queries done in pure Python, so it needs nothing but
+Owyl. The flock is driven by a
+L{TreeScheduler<owyl.scheduler.TreeScheduler>} at a fixed timestep,
+and the number of ticks per second is reported at the end. This makes
+it a convenient macro benchmark::
+
+    $ python headless.py --boids 100 --ticks 500
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import random
+import time
+from optparse import OptionParser
+
+import owyl
+from owyl import blackboard
+
+from flocking import Flocking
+
+
+class HeadlessBoid(Flocking):
+    """A member of a flock with no sprite behind it.
+    """
+    boids = []
+
+    def __init__(self, blackboard, x=0.0, y=0.0, rotation=0.0):
+        self.bb = blackboard
+        self.boids.append(self)
+        self.x = x
+        self.y = y
+        self.rotation = rotation
+        self.speed = 200
+        self.bounding_radius = 5
+        self.bounding_radius_squared = 25
+        self.neighborhood_radius = 1000
+        self.personal_radius = 20
+
+    def findNeighbors(self, radius):
+        """Find the other boids I can see within the given radius.
+
+        A boid is within the radius if its bounding circle is.
+
+        @rtype: C{list} of L{HeadlessBoid}s.
+        """
+        x = self.x
+        y = self.y
+        found = []
+        for other in self.others:
+            dx = other.x - x
+            dy = other.y - y
+            reach = radius + other.bounding_radius
+            if dx * dx + dy * dy <= reach * reach:
+                found.append(other)
+        return found
+
+
+def makeFlock(how_many, scheduler, bb, seed=None):
+    """Create a flock of boids, and add their trees to a scheduler.
+
+    @return: the boids.
+    """
+    rand = random.Random(seed)
+    del HeadlessBoid.boids[:]
+    flock = []
+    for x in xrange(how_many):
+        boid = HeadlessBoid(bb,
+                            x=rand.randint(0, 200),
+                            y=rand.randint(0, 200),
+                            rotation=rand.randint(1, 360))
+        scheduler.add(boid.buildTree(), blackboard=bb, agent=boid)
+        flock.append(boid)
+    return flock
+
+
+def run(how_many=50, ticks=1000, dt=1.0 / 60, seed=None):
+    """Run a flock for a number of fixed timesteps.
+
+    @return: the number of ticks per second.
+    """
+    scheduler = owyl.TreeScheduler()
+    bb = blackboard.Blackboard('headless')
+    makeFlock(how_many, scheduler, bb, seed)
+    bb['dt'] = dt
+    start = time.time()
+    for x in xrange(ticks):
+        scheduler.tick()
+    return ticks / max(time.time() - start, 1e-9)
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('-b', '--boids', type='int', default=50,
+                      help="number of boids (default %default)")
+    parser.add_option('-t', '--ticks', type='int', default=1000,
+                      help="number of ticks to run (default %default)")
+    parser.add_option('--dt', type='float', default=1.0 / 60,
+                      help="timestep in seconds (default %default)")
+    parser.add_option('--seed', type='int', default=None,
+                      help="random seed for the starting positions")
+    options, args = parser.parse_args(argv)
+    rate = run(options.boids, options.ticks, options.dt, options.seed)
+    print "%d boids: %.1f ticks/s, %.1f boid-ticks/s" % (
+        options.boids, rate, rate * options.boids)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 """steering -- common steering helpers.
 
+L{Steering} is pure math, and can be used without any graphics
+libraries. L{Steerable} is a cocos2d sprite with the same helpers, and
+is only defined when cocos is installed.
 
 Copyright 2008 David Eyk. All rights reserved.
 
@@ -13,7 +16,10 @@ __author__ = "$Author$"[9:-2]
 __revision__ = "$Rev: 41 $"[6:-2]
 __date__ = "$Date: 2009-01-15 22:37:46 -0600 (Thu, 15 Jan 2009) $"[7:-2]
 
-from cocos.sprite import Sprite
+try:
+    from cocos.sprite import Sprite
+except ImportError:
+    Sprite = None
 
 from math import atan2, pi
 pi_2 = pi*2.0
@@ -22,18 +28,9 @@ pi_1_4 = pi/4.0
 pi_3_4 = (pi*3)/4
 
 
-class Steerable(Sprite):
-    """A steerable sprite, with helpers for figuring rotations and vectors.
+class Steering(object):
+    """Helpers for figuring rotations and vectors.
     """
-    def __init__(self, image):
-        super(Steerable, self).__init__(self._img)
-        self.speed = 0
-
-        self.bounding_radius = 1
-        self.bounding_radius_squared = 1
-        
-        self.personal_radius = 1
-
     def findRotationDelta(self, this_heading, that_heading):
         """Find the change in rotation required to match a given heading.
         
@@ -53,3 +50,15 @@ class Steerable(Sprite):
         return -(atan2(ty, tx) - pi_1_2)
 
 
+if Sprite is not None:
+    class Steerable(Steering, Sprite):
+        """A steerable sprite.
+        """
+        def __init__(self, image):
+            super(Steerable, self).__init__(self._img)
+            self.speed = 0
+
+            self.bounding_radius = 1
+            self.bounding_radius_squared = 1
+
+            self.personal_radius = 1
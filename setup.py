@@ -41,6 +41,7 @@ except ImportError:
 from setuptools import setup, find_packages
 
 INSTALL_REQUIRES=[]
+EXTRAS_REQUIRE={'dsl': ['PyYAML'],}
 ZIP_SAFE = True
 
 setup(
@@ -62,8 +63,11 @@ setup(
     #data_files=['src/data',],
 
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     zip_safe = ZIP_SAFE,
 
+    entry_points = {'console_scripts': ['owyl-bench = owyl.bench:main',],},
+
     test_suite = "nose.collector",
     )
 
@@ -70,3 +70,4 @@ __date__ = "$Date$"[7:-2]
 from core import *
 from decorators import *
 from blackboard import *
+from scheduler import *
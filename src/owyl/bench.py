@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""bench -- microbenchmarks for Owyl.
+
+Each benchmark builds a tree from one kind of node, C{depth} levels
+deep and C{width} children wide, and runs it to completion over and
+over. A I{tick} is one complete pass through the tree. Results are
+reported as ticks per second, and as nanoseconds per node visited::
+
+    $ python -m owyl.bench --depth 3 --width 4 sequence selector
+
+Benchmarks can also be run from code, with L{run}:
+
+    >>> ticks, ns = run('sequence', depth=3, width=4)
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import sys
+import time
+from optparse import OptionParser
+
+import core
+import decorators
+import blackboard
+
+__all__ = ['BENCHMARKS', 'run', 'main']
+
+
+def _grow(composite, depth, width, leaf, **kwargs):
+    """Build a tree of composites over leaves.
+
+    @param leaf: Called with the leaf's index to build each leaf.
+
+    @return: the tree, and its number of nodes.
+    """
+    leaves = [0]
+
+    def grow(level):
+        if level == depth:
+            leaves[0] += 1
+            return leaf(leaves[0] - 1), 1
+        children = []
+        count = 1
+        for x in xrange(width):
+            child, size = grow(level + 1)
+            children.append(child)
+            count += size
+        return composite(*children, **kwargs), count
+    return grow(0)
+
+
+def _visits(tree, **kwargs):
+    """Return a pass that visits the tree to completion.
+    """
+    def tick():
+        for x in core.visit(tree, **kwargs):
+            pass
+    return tick
+
+
+def benchVisit(depth, width):
+    """A chain of identity decorators over a leaf.
+
+    This measures the trampolining of the visitor itself.
+    """
+    tree = core.succeed()
+    for x in xrange(depth * width):
+        tree = decorators.identity(tree)
+    return _visits(tree), depth * width + 1
+
+
+def benchSequence(depth, width):
+    """Nested sequences of succeeding leaves.
+    """
+    tree, count = _grow(core.sequence, depth, width,
+                        lambda i: core.succeed())
+    return _visits(tree), count
+
+
+def benchSelector(depth, width):
+    """Nested selectors of failing leaves.
+    """
+    tree, count = _grow(core.selector, depth, width,
+                        lambda i: core.fail())
+    return _visits(tree), count
+
+
+def benchParallelAll(depth, width):
+    """Nested parallels of succeeding leaves, all of which must succeed.
+    """
+    tree, count = _grow(core.parallel, depth, width,
+                        lambda i: core.succeed(),
+                        policy=core.PARALLEL_SUCCESS.REQUIRE_ALL)
+    return _visits(tree), count
+
+
+def benchParallelOne(depth, width):
+    """Nested parallels of failing leaves, one of which must succeed.
+    """
+    tree, count = _grow(core.parallel, depth, width,
+                        lambda i: core.fail(),
+                        policy=core.PARALLEL_SUCCESS.REQUIRE_ONE)
+    return _visits(tree), count
+
+
+def _queued(queue, depth, width, steps):
+    """Return a pass that feeds C{width ** depth} leaves through a
+    long-running queue task, taking C{steps(count)} steps.
+    """
+    count = width ** depth
+    leaves = [core.succeed() for x in xrange(count)]
+    tasks = core.TaskQueue()
+    visitor = core.visit(queue(tasks))
+    step = visitor.next
+
+    def tick():
+        tasks.tasks.extend(leaves)
+        for x in xrange(steps(count)):
+            step()
+    return tick, count + 1
+
+
+def benchQueue(depth, width):
+    """A queue of leaves, run one after the other.
+    """
+    return _queued(core.queue, depth, width, lambda count: count)
+
+
+def benchParallelQueue(depth, width):
+    """A queue of leaves, run in parallel.
+    """
+    return _queued(core.parallel_queue, depth, width, lambda count: 1)
+
+
+_DECORATORS = (decorators.identity, decorators.flip, decorators.flip,
+               decorators.repeatUntilSucceed)
+
+
+def benchDecorators(depth, width):
+    """A sequence of chains of decorators over succeeding leaves.
+    """
+    def chain(i):
+        node = core.succeed()
+        for level in xrange(depth):
+            node = _DECORATORS[level % len(_DECORATORS)](node)
+        if depth % len(_DECORATORS) == 2:
+            node = decorators.flip(node)  # Undo the odd flip.
+        return node
+    size = depth + (depth % len(_DECORATORS) == 2) + 1
+    tree = core.sequence(*[chain(i) for i in xrange(width)])
+    return _visits(tree), width * size + 1
+
+
+def benchBlackboard(depth, width):
+    """Nested sequences of alternating setBB and checkBB leaves.
+    """
+    def leaf(i):
+        if i % 2:
+            return blackboard.checkBB(key=i // 2)
+        return blackboard.setBB(key=i // 2, value=i)
+    tree, count = _grow(core.sequence, depth, width, leaf)
+    bb = blackboard.Blackboard('owyl.bench')
+    return _visits(tree, blackboard=bb), count
+
+
+BENCHMARKS = [('visit', benchVisit),
+              ('sequence', benchSequence),
+              ('selector', benchSelector),
+              ('parallel-all', benchParallelAll),
+              ('parallel-one', benchParallelOne),
+              ('queue', benchQueue),
+              ('parallel_queue', benchParallelQueue),
+              ('decorators', benchDecorators),
+              ('blackboard', benchBlackboard),]
+
+
+def run(name, depth=3, width=4, number=1000, repeat=3):
+    """Run a benchmark, and return its best result.
+
+    @param name: The name of the benchmark, from L{BENCHMARKS}.
+
+    @keyword number: The number of ticks to time.
+    @keyword repeat: The number of times to time them.
+
+    @return: ticks per second, and nanoseconds per node.
+    """
+    bench = dict(BENCHMARKS)[name]
+    tick, count = bench(depth, width)
+    tick()  # Warm up.
+    best = None
+    for x in xrange(repeat):
+        start = time.time()
+        for y in xrange(number):
+            tick()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    best = max(best, 1e-9)
+    return number / best, best * 1e9 / (number * count)
+
+
+def main(argv=None):
+    """Run benchmarks from the command line.
+    """
+    names = [name for name, bench in BENCHMARKS]
+    parser = OptionParser(usage="%prog [options] [benchmark ...]",
+                          description="Benchmarks: " + ', '.join(names))
+    parser.add_option('-d', '--depth', type='int', default=3,
+                      help="levels of composites (default %default)")
+    parser.add_option('-w', '--width', type='int', default=4,
+                      help="children per composite (default %default)")
+    parser.add_option('-n', '--number', type='int', default=1000,
+                      help="ticks per timing (default %default)")
+    parser.add_option('-r', '--repeat', type='int', default=3,
+                      help="timings per benchmark (default %default)")
+    options, args = parser.parse_args(argv)
+    for name in args:
+        if name not in names:
+            parser.error("unknown benchmark: %s" % name)
+    print "depth=%d width=%d number=%d repeat=%d" % (
+        options.depth, options.width, options.number, options.repeat)
+    for name in args or names:
+        ticks, ns = run(name, options.depth, options.width,
+                        options.number, options.repeat)
+        print "%-16s %14.1f ticks/s %12.1f ns/node" % (name, ticks, ns)
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,7 @@ from collections import defaultdict
 
 import core
 
-__all__ = ['Blackboard', 'checkBB', 'setBB', ]
+__all__ = ['Blackboard', 'WaitForKey', 'checkBB', 'setBB', 'waitBB', ]
 
 
 class Blackboard(defaultdict):
@@ -27,15 +27,109 @@ class Blackboard(defaultdict):
 
     Blackboards are registered by name. All blackboards with the same
     name have the same contents.
+
+    Callbacks may L{watch} a key, to be called the next time the key
+    is written or removed, by any of the dict methods.
     """
     _name_dict = defaultdict(dict)  # For a twist on the Borg idiom
 
     def __init__(self, name, **kwargs):
         self.__dict__ = Blackboard._name_dict[name]
+        self.__dict__.setdefault('_watchers', {})
 
         default = lambda: None
         super(Blackboard, self).__init__(default, **kwargs)
 
+    def __missing__(self, key):
+        # Store the default without notifying watchers: reading a key
+        # isn't writing it.
+        value = self.default_factory()
+        defaultdict.__setitem__(self, key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        defaultdict.__setitem__(self, key, value)
+        if key in self._watchers:
+            self._notify(key)
+
+    def __delitem__(self, key):
+        defaultdict.__delitem__(self, key)
+        if key in self._watchers:
+            self._notify(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).iteritems():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return defaultdict.__getitem__(self, key)
+        self[key] = default
+        return default
+
+    def pop(self, key, *default):
+        if key not in self:
+            return defaultdict.pop(self, key, *default)
+        value = defaultdict.pop(self, key)
+        if key in self._watchers:
+            self._notify(key)
+        return value
+
+    def popitem(self):
+        key, value = defaultdict.popitem(self)
+        if key in self._watchers:
+            self._notify(key)
+        return key, value
+
+    def clear(self):
+        removed = [key for key in self._watchers if key in self]
+        defaultdict.clear(self)
+        for key in removed:
+            self._notify(key)
+
+    def _notify(self, key):
+        for callback in self._watchers.pop(key, ()):
+            callback()
+
+    def watch(self, key, callback):
+        """Call callback() once, the next time the key is written.
+        """
+        self._watchers.setdefault(key, []).append(callback)
+
+    def unwatch(self, key, callback):
+        """Stop watching the key.
+        """
+        callbacks = self._watchers.get(key, ())
+        if callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._watchers[key]
+
+
+class WaitForKey(core.Wait):
+    """Wait for a key to be written on the blackboard.
+
+    A task yielding this wait is resumed with the key's new value.
+    """
+    def __init__(self, blackboard, key):
+        self.blackboard = blackboard
+        self.key = key
+        self.wake = None
+
+    def arm(self, wake):
+        self.wake = wake
+        self.blackboard.watch(self.key, self.fire)
+
+    def disarm(self):
+        self.blackboard.unwatch(self.key, self.fire)
+        self.wake = None
+
+    def fire(self):
+        self.value = self.blackboard[self.key]
+        wake, self.wake = self.wake, None
+        if wake is not None:
+            wake()
+
 
 @core.task
 def checkBB(**kwargs):
@@ -73,3 +167,26 @@ def setBB(**kwargs):
     value = kwargs['value']
     bb[key] = value
     yield True
+
+
+@core.task
+def waitBB(**kwargs):
+    """Wait until a value on the blackboard passes a check.
+
+    Unlike polling L{checkBB}, the branch is parked between writes to
+    the key, and costs nothing while it waits.
+
+    @keyword blackboard: The blackboard object.
+
+    @keyword key: The name of a key on the blackboard.
+    @type key: A hashable object
+
+    @keyword check: A function that takes the value on the blackboard
+                    and returns a boolean.
+    """
+    bb = kwargs['blackboard']
+    key = kwargs['key']
+    check = kwargs.get('check', lambda x: x is not None)
+    while not check(bb[key]):
+        yield WaitForKey(bb, key)
+    yield True
@@ -13,18 +13,42 @@ __revision__ = "$Rev$"[6:-2]
 __date__ = "$Date$"[7:-2]
 
 import logging
+import random
+import sys
+import threading
+import time
+import weakref
+from collections import deque
+from types import GeneratorType
+from functools import partial
+from heapq import heappush, heappop
+from itertools import count
 
 try:
     from mx.Stack import Stack, EmptyError
 except ImportError:
     from stack import Stack, EmptyError
 
+try:
+    from asyncio import ensure_future
+except ImportError:
+    ensure_future = None
+
 RETURN_VALUES = set((True, False, None))
 
-__all__ = ['wrap', 'task', 'taskmethod', 'parent_task', 'parent_taskmethod', 'visit', 
-           'succeed', 'fail', 'succeedAfter', 'failAfter', 
+_monitor = None  # See setMonitor()
+_nested = [0.0]  # Time spent in monitored steps, for nested visitors
+
+__all__ = ['wrap', 'task', 'taskmethod', 'agentmethod',
+           'parent_task', 'parent_taskmethod',
+           'async_task', 'visit', 'Visitor', 'Wait', 'FutureWait',
+           'setMonitor', 'nodeName', 'runningVisitor',
+           'succeed', 'fail', 'succeedAfter', 'failAfter', 'offload',
            'sequence', 'selector', 'parallel', 'PARALLEL_SUCCESS',
-           'queue', 'parallel_queue',
+           'utilitySelector', 'reactiveSelector',
+           'weightedSelector', 'weightedSequence', 'AliasTable',
+           'queue', 'parallel_queue', 'priority_queue',
+           'TaskQueue', 'PriorityTaskQueue',
            'throw', 'catch',
            'log',]
 
@@ -53,6 +77,10 @@ def task(func):
 
     Decorate a generator function to produce a re-usable generator
     factory for the given task.
+
+    The factory records how it was built, as its C{builder},
+    C{children} and C{initkwargs} attributes, for tools that rewrite
+    trees (such as L{owyl.optimize}).
     """
     def initTask(**initkwargs):
         def makeIterator(**runkwargs):
@@ -63,6 +91,9 @@ def task(func):
         except AttributeError: pass
         try: makeIterator.__doc__ = func.__doc__
         except AttributeError: pass
+        makeIterator.builder = initTask
+        makeIterator.children = ()
+        makeIterator.initkwargs = initkwargs
         return makeIterator
     try: initTask.__doc__ = func.__doc__
     except AttributeError: pass
@@ -86,6 +117,9 @@ def taskmethod(func):
         except AttributeError: pass
         try: makeIterator.__doc__ = func.__doc__
         except AttributeError: pass
+        makeIterator.builder = partial(initTask, self)
+        makeIterator.children = ()
+        makeIterator.initkwargs = initkwargs
         return makeIterator
     try: initTask.__doc__ = func.__doc__
     except AttributeError: pass
@@ -94,13 +128,45 @@ def taskmethod(func):
     return initTask
 
 
+def agentmethod(func):
+    """Agent method decorator.
+
+    Like L{taskmethod}, but the instance isn't bound when the tree is
+    built: it is passed at run time, as the C{agent} keyword
+    argument. A tree built from agent methods on the class can then be
+    shared by every agent of that class:
+
+        >>> tree = sequence(Boid.move(), Boid.seek(rate=5))
+        >>> visitor = visit(tree, agent=boid, blackboard=bb)
+    """
+    def initTask(**initkwargs):
+        def makeIterator(**runkwargs):
+            runkwargs.update(initkwargs)
+            iterator = func(runkwargs['agent'], **runkwargs)
+            return iterator
+        try: makeIterator.__name__ = func.__name__
+        except AttributeError: pass
+        try: makeIterator.__doc__ = func.__doc__
+        except AttributeError: pass
+        makeIterator.builder = initTask
+        makeIterator.children = ()
+        makeIterator.initkwargs = initkwargs
+        return makeIterator
+    try: initTask.__doc__ = func.__doc__
+    except AttributeError: pass
+    try: initTask.__name__ = func.__name__
+    except AttributeError: pass
+    return staticmethod(initTask)
+
+
 def parent_task(func):
     """Parent task decorator.
 
     A parent task is a task that accepts children.
 
     Decorate a generator function to produce a re-usable generator
-    factory for the given task.
+    factory for the given task. As with L{task}, the factory records
+    how it was built.
     """
     def initTask(*children, **initkwargs):
         def makeIterator(**runkwargs):
@@ -111,6 +177,9 @@ def parent_task(func):
         except AttributeError: pass
         try: makeIterator.__doc__ = func.__doc__
         except AttributeError: pass
+        makeIterator.builder = initTask
+        makeIterator.children = children
+        makeIterator.initkwargs = initkwargs
         return makeIterator
     try: initTask.__doc__ = func.__doc__
     except AttributeError: pass
@@ -136,6 +205,9 @@ def parent_taskmethod(func):
         except AttributeError: pass
         try: makeIterator.__doc__ = func.__doc__
         except AttributeError: pass
+        makeIterator.builder = partial(initTask, self)
+        makeIterator.children = children
+        makeIterator.initkwargs = initkwargs
         return makeIterator
     try: initTask.__doc__ = func.__doc__
     except AttributeError: pass
@@ -144,15 +216,478 @@ def parent_taskmethod(func):
     return initTask
 
 
+class Wait(object):
+    """Base class for wait conditions.
+
+    A task may yield a Wait instead of yielding None to poll. The
+    visitor will park the branch, yielding None without resuming any
+    iterator, until the wait condition calls back. The task is then
+    resumed with the wait's C{value}:
+
+    >>> value = yield WaitForKey(bb, 'enemy')
+
+    Subclasses must implement L{arm} and L{disarm}.
+
+    @ivar value: The value sent to the waiting task when it resumes.
+    """
+    value = None
+
+    def arm(self, wake):
+        """Call C{wake()} once, when the condition is met.
+
+        C{wake} may be called immediately if the condition is already
+        met.
+        """
+        raise NotImplementedError
+
+    def disarm(self):
+        """Stop waiting. C{wake} must not be called afterwards.
+        """
+        pass
+
+
+class FutureWait(Wait):
+    """Wait for a future to be done.
+
+    Any future implementing C{done()} and C{add_done_callback()} will
+    do, such as those of C{asyncio} or C{concurrent.futures}. The
+    waiting task is resumed with the future itself.
+    """
+    def __init__(self, future):
+        self.value = future
+        self.wake = None
+
+    def arm(self, wake):
+        self.wake = wake
+        self.value.add_done_callback(self.fire)
+
+    def disarm(self):
+        self.wake = None
+
+    def fire(self, future):
+        wake, self.wake = self.wake, None
+        if wake is not None:
+            wake()
+
+
+def _awaitFuture(func, kwargs):
+    """Iterate over the result of a future-returning callable.
+    """
+    future = func(**kwargs)
+    if not hasattr(future, 'add_done_callback'):
+        if ensure_future is None:
+            raise TypeError("%s did not return a future" % func.__name__)
+        future = ensure_future(future)
+    if not future.done():
+        try:
+            yield FutureWait(future)
+        except GeneratorExit:
+            future.cancel()
+            raise
+    yield bool(future.result())
+
+
+def async_task(func):
+    """Asynchronous task decorator.
+
+    Decorate a function returning a future (or, where C{asyncio} is
+    available, a coroutine function) to produce a re-usable task
+    factory. The task parks on the future without polling (see
+    L{FutureWait}) and yields the boolean of its result. Exceptions
+    set on the future are raised in the tree.
+    """
+    def initTask(**initkwargs):
+        def makeIterator(**runkwargs):
+            runkwargs.update(initkwargs)
+            return _awaitFuture(func, runkwargs)
+        try: makeIterator.__name__ = func.__name__
+        except AttributeError: pass
+        try: makeIterator.__doc__ = func.__doc__
+        except AttributeError: pass
+        makeIterator.builder = initTask
+        makeIterator.children = ()
+        makeIterator.initkwargs = initkwargs
+        return makeIterator
+    try: initTask.__doc__ = func.__doc__
+    except AttributeError: pass
+    try: initTask.__name__ = func.__name__
+    except AttributeError: pass
+    return initTask
+
+
+def setMonitor(monitor):
+    """Install a monitor for all visitors created from now on.
+
+    Monitors are opt-in instrumentation, such as profilers or tracers.
+    A monitor implements C{attach(visitor)}, which returns an object
+    of hooks for that visitor, or None to leave the visitor
+    unmonitored (at no cost). The hooks are called as the visitor
+    runs:
+
+      - C{enter(node)}: the node's iterator was started.
+      - C{status(node, value)}: the node yielded True, False or None.
+      - C{exit(node, result, total, own)}: the node finished, passing
+        C{result} to its parent, having taken C{total} seconds
+        including its children and C{own} seconds excluding them.
+
+    In C{attach()}, a monitor may also set the visitor's C{context}
+    to a dict of keyword arguments to add to the tree's. Parent tasks
+    pass them on to the nested visitors they run, so the monitor can
+    tell those visitors apart from the roots of new trees without
+    inspecting the call stack.
+
+    Pass None to remove the monitor.
+    """
+    global _monitor
+    _monitor = monitor
+
+
+def nodeName(node):
+    """Return the name of a running node, for reports.
+    """
+    return getattr(node, '__name__', None) or type(node).__name__
+
+
+class Visitor(object):
+    """Iterate over a tree of nested iterators.
+
+    See L{visit}. In addition to the iterator protocol, the visitor
+    exposes its running state:
+
+    @ivar stack: The running parent iterators.
+    @ivar current: The iterator currently being visited.
+    @ivar waiting: The L{Wait} the visitor is parked on, if any.
+    @ivar finished: True once the tree has run to completion, or has
+                    been closed.
+    @ivar result: The last True or False yielded during L{advance}.
+    @ivar exhausted: True if the last L{advance} ran out of budget.
+
+    @ivar onwait: Called with no arguments when the visitor parks on a
+                  L{Wait}.
+    @ivar onwake: Called with no arguments when the wait is over. This
+                  may be called from another thread.
+    @ivar hooks: The monitor hooks attached to this visitor, if any.
+                 (See L{setMonitor}.)
+    @ivar context: Keyword arguments added to the tree's run-time
+                   keyword arguments by the monitor, if any. They are
+                   kept across L{reset}.
+    """
+    # Visitors are created often, so the attributes that usually keep
+    # their defaults are set on the class.
+    waiting = None
+    finished = False
+    result = None
+    exhausted = False
+    onwait = None
+    onwake = None
+    hooks = None
+    context = None
+
+    def __init__(self, tree, **kwargs):
+        self.tree = tree
+        self.kwargs = kwargs
+        self.stack = Stack()
+        if _monitor is None:
+            self._iterator = self._run()
+        else:
+            self.hooks = _monitor.attach(self)
+            if self.context:
+                kwargs.update(self.context)
+            self._iterator = self._start()
+        self.next = self._iterator.next
+
+    @property
+    def current(self):
+        """The iterator currently being visited.
+
+        The visitor keeps this in a local variable while it runs, so
+        reading it looks into the visitor's frame; it's meant for
+        monitors and samplers, not for every step.
+        """
+        frame = self._iterator.gi_frame
+        if frame is None:
+            return None
+        return frame.f_locals.get('current')
+
+    def __iter__(self):
+        return self._iterator
+
+    def next(self):
+        return self._iterator.next()
+
+    def reset(self, **kwargs):
+        """Restart the visitor from the root of its tree, with new
+        keyword arguments.
+
+        The visitor, its stack and its hooks are kept, so a visitor can
+        be recycled for a new agent instead of being reallocated. The
+        tree's running iterators are closed first (see L{close}).
+        """
+        self.close()
+        if self.context:
+            kwargs.update(self.context)
+        self.kwargs = kwargs
+        self.finished = self.exhausted = False
+        self.result = None
+        self._iterator = self._start()
+        self.next = self._iterator.next
+
+    def close(self):
+        """Halt the tree, closing the iterators that are running.
+
+        The running iterators are closed innermost first, so the
+        C{finally} blocks of the abandoned tasks run at once, rather
+        than whenever the iterators are collected. Parent tasks that
+        run their children in nested visitors close those visitors in
+        turn, so the halt reaches the whole running branch. A pending
+        L{Wait} is disarmed.
+
+        Closing a visitor that has finished does nothing. Once closed,
+        the visitor is L{finished}.
+
+        A visitor closed by a task in its own tree, while it is being
+        stepped, can't close its iterators until the step returns: it
+        is only marked L{finished}, and whoever is stepping it should
+        call C{close()} again afterwards (as L{TreeScheduler
+        <owyl.scheduler.TreeScheduler>} does).
+        """
+        if self._iterator.gi_running:
+            self.finished = True
+            return
+        if self.waiting is not None:
+            self.waiting.disarm()
+            self.waiting = None
+        running = [self.current]
+        pop = self.stack.pop  # Innermost first. (mx.Stack can't slice.)
+        try:
+            while True:
+                running.append(pop())
+        except EmptyError:
+            pass
+        self.finished = True
+        self._iterator.close()
+        for iterator in running:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    def advance(self, steps=None, seconds=None):
+        """Advance the tree as far as possible within a budget.
+
+        Step the visitor until the tree stalls (yields None), runs to
+        completion, or the budget is exhausted, whichever comes
+        first. At least one step is always taken. The next call
+        resumes exactly where this one stopped.
+
+        @keyword steps: The maximum number of steps to take.
+        @type steps: int
+
+        @keyword seconds: The maximum wall-clock time to spend.
+        @type seconds: float
+
+        @return: True if the budget was exhausted before the tree
+                 stalled or finished. The last status yielded is
+                 available as L{result}.
+        """
+        step = self.next
+        now = time.time
+        if seconds is not None:
+            deadline = now() + seconds
+        count = 0
+        self.exhausted = False
+        while True:
+            try:
+                value = step()
+            except StopIteration:
+                return False
+            if value is None:
+                return False
+            self.result = value
+            count += 1
+            if ((steps is not None and count >= steps)
+                or (seconds is not None and now() >= deadline)):
+                self.exhausted = True
+                return True
+
+    def run_until_stall(self):
+        """Drive the tree until it stalls or terminates.
+
+        Where iterating the visitor yields every status passed up the
+        tree, this collapses one logical tick of the tree into a
+        single call.
+
+        @return: None if the tree stalled, or the tree's final status
+                 if it terminated.
+        @raise StopIteration: if the tree had already terminated.
+        """
+        step = self.next
+        result = None
+        try:
+            while True:
+                value = step()
+                if value is None:
+                    return None
+                result = value
+        except StopIteration:
+            if result is None:
+                raise
+            return result
+
+    def _wake(self, wait):
+        if self.waiting is wait:
+            self.waiting = None
+            if self.onwake is not None:
+                self.onwake()
+
+    def _park(self, wait):
+        self.waiting = wait
+        if self.onwait is not None:
+            self.onwait()
+        wait.arm(partial(self._wake, wait))
+
+    def _start(self):
+        if self.hooks is None:
+            return self._run()
+        return self._runMonitored()
+
+    def _run(self):
+        s = self.stack
+        return_values = RETURN_VALUES
+        generator = GeneratorType
+
+        current = self.tree(**self.kwargs)
+        send_value = None
+        send_ok = False
+        while True:
+            try:
+                if send_ok:
+                    child = current.send(send_value)
+                    send_value = None
+                    send_ok = False
+                else:
+                    child = current.next()
+
+                if child in return_values:
+                    send_value = child
+                    yield send_value
+                elif type(child) is generator or not isinstance(child, Wait):
+                    # Descend into child node
+                    s.push(current)
+                    current = child
+                else:
+                    # Park until the wait calls back, then resume the
+                    # task with the wait's value.
+                    self._park(child)
+                    while self.waiting is child:
+                        yield None
+                    send_value = child.value
+                    send_ok = True
+
+            except StopIteration:
+                try:
+                    current = s.pop()
+                    send_ok = True
+                except EmptyError:
+                    self.finished = True
+                    return
+
+    def _runMonitored(self):
+        """Like L{_run}, but time each step and report to the hooks.
+        """
+        s = self.stack
+        return_values = RETURN_VALUES
+        hooks = self.hooks
+        enter, status, leave = hooks.enter, hooks.status, hooks.exit
+        clock = time.time
+        nested = _nested
+        frames = []  # (own, children) times of the running parents
+
+        current = self.tree(**self.kwargs)
+        enter(current)
+        own = children = 0.0
+        send_value = None
+        send_ok = False
+        while True:
+            try:
+                start = clock()
+                before = nested[0]
+                try:
+                    if send_ok:
+                        child = current.send(send_value)
+                        send_value = None
+                        send_ok = False
+                    else:
+                        child = current.next()
+                finally:
+                    # Time spent in nested visitors counts as children.
+                    elapsed = clock() - start
+                    inner = nested[0] - before
+                    own += elapsed - inner
+                    children += inner
+                    nested[0] = before + elapsed
+
+                if child in return_values:
+                    send_value = child
+                    status(current, child)
+                    yield send_value
+                elif type(child) is GeneratorType or not isinstance(child,
+                                                                   Wait):
+                    s.push(current)
+                    frames.append((own, children))
+                    own = children = 0.0
+                    current = child
+                    enter(current)
+                else:
+                    self._park(child)
+                    while self.waiting is child:
+                        yield None
+                    send_value = child.value
+                    send_ok = True
+
+            except StopIteration:
+                total = own + children
+                leave(current, send_value, total, own)
+                try:
+                    current = s.pop()
+                    own, children = frames.pop()
+                    children += total
+                    send_ok = True
+                except EmptyError:
+                    self.finished = True
+                    return
+
+
+_RUN_CODES = (Visitor._run.im_func.func_code,
+              Visitor._runMonitored.im_func.func_code)
+
+
+def runningVisitor():
+    """Return the visitor being stepped in this thread, if any.
+
+    Parent tasks that run their children in nested visitors (such as
+    L{parallel}) do so while their own visitor is stepping them, so a
+    monitor can use this in C{attach()} to find a new visitor's
+    parent. It inspects the call stack, and is not meant for use on
+    every step.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code in _RUN_CODES:
+            return frame.f_locals.get('self')
+        frame = frame.f_back
+    return None
+
+
 def visit(tree, **kwargs):
     """Iterate over a tree of nested iterators.
 
     Apply the U{Visitor
     Pattern<http://en.wikipedia.org/wiki/Visitor_pattern>} to a tree
-    of nested iterators. Iterators should yield True, False, None, or
-    a child iterator. Values of True or False are passed back to the
-    parent iterator. A value of None is silently ignored, and the
-    current iterator will be queried again on the next pass.
+    of nested iterators. Iterators should yield True, False, None, a
+    L{Wait}, or a child iterator. Values of True or False are passed
+    back to the parent iterator. A value of None is silently ignored,
+    and the current iterator will be queried again on the next pass. A
+    L{Wait} parks the current iterator until the wait is over.
 
     The visitor will yield None until the tree raises StopIteration,
     upon which the visitor will yield the last value yielded by the
@@ -162,36 +697,10 @@ def visit(tree, **kwargs):
     implemented as a tree of nested iterators. For more information,
     see the discussion at
     U{http://aigamedev.com/programming-tips/scheduler}.
-    """
-    s = Stack()
-    return_values = RETURN_VALUES
-
-    current = tree(**kwargs)
-    send_value = None
-    send_ok = False
-    while True:
-        try:
-            if send_ok:
-                child = current.send(send_value)
-                send_value = None
-                send_ok = False
-            else:
-                child = current.next()
 
-            if child in return_values:
-                send_value = child
-                yield send_value
-            else:
-                # Descend into child node
-                s.push(current)
-                current = child
-                
-        except StopIteration:
-            try:
-                current = s.pop()
-                send_ok = True
-            except EmptyError:
-                raise StopIteration
+    @rtype: L{Visitor}
+    """
+    return Visitor(tree, **kwargs)
 
 
 @task
@@ -257,6 +766,81 @@ def failAfter(**kwargs):
     yield False
 
 
+_in_flight = weakref.WeakKeyDictionary()  # Submitted calls per executor
+_in_flight_lock = threading.Lock()
+
+
+def _acquireSlot(executor, limit):
+    with _in_flight_lock:
+        count = _in_flight.get(executor, 0)
+        if limit is not None and count >= limit:
+            return False
+        _in_flight[executor] = count + 1
+        return True
+
+
+def _releaseSlot(executor):
+    with _in_flight_lock:
+        _in_flight[executor] -= 1
+
+
+def _offload(func, args, kwargs, runkwargs):
+    """Iterate over the result of a callable run on an executor.
+    """
+    executor = runkwargs['executor']
+    limit = runkwargs.get('max_in_flight')
+    while not _acquireSlot(executor, limit):
+        yield None
+    try:
+        future = executor.submit(func, *args, **kwargs)
+    except:
+        _releaseSlot(executor)
+        raise
+    future.add_done_callback(lambda f: _releaseSlot(executor))
+    if not future.done():
+        try:
+            yield FutureWait(future)
+        except GeneratorExit:
+            # Closed while waiting: don't run a call nobody will read.
+            future.cancel()
+            raise
+    yield bool(future.result())
+
+
+def offload(func, *args, **kwargs):
+    """Wrap a callable as a task run on an executor. Yield the boolean
+    of its result.
+
+    The callable is submitted to the executor (such as a
+    C{concurrent.futures} thread or process pool), and the task parks
+    on the returned future, yielding None until it is done, so that
+    slow or CPU-heavy work doesn't stall the rest of the tree.
+
+    @keyword executor: The executor to submit to. Usually given to
+                       L{visit} so the whole tree shares it.
+    @type executor: An object implementing C{submit()}
+
+    @keyword max_in_flight: The most calls that may be pending on the
+                            executor at once. Further tasks yield None
+                            until a call completes.
+    @type max_in_flight: int
+    """
+    def initTask(**initkwargs):
+        def makeIterator(**runkwargs):
+            runkwargs.update(initkwargs)
+            return _offload(func, args, kwargs, runkwargs)
+        try: makeIterator.__name__ = func.__name__
+        except AttributeError: pass
+        try: makeIterator.__doc__ = func.__doc__
+        except AttributeError: pass
+        return makeIterator
+    try: initTask.__doc__ = func.__doc__
+    except AttributeError: pass
+    try: initTask.__name__ = func.__name__
+    except AttributeError: pass
+    return initTask
+
+
 @parent_task
 def sequence(*children, **kwargs):
     """Run tasks in sequence until one fails.
@@ -279,6 +863,149 @@ def sequence(*children, **kwargs):
     yield final_value
 
 
+class TaskQueue(object):
+    """A bounded first-in, first-out queue of tasks.
+
+    Use it with L{queue} or L{parallel_queue}, which count the results
+    of the tasks they run from it.
+
+    @ivar completed: The number of tasks that succeeded.
+    @ivar failed: The number of tasks that failed.
+    """
+    def __init__(self, maxsize=None):
+        """
+        @keyword maxsize: The most tasks to hold. (Default: unbounded.)
+        @type maxsize: int
+        """
+        self.tasks = deque()
+        self.maxsize = maxsize
+        self.completed = 0
+        self.failed = 0
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __nonzero__(self):
+        return bool(self.tasks)
+
+    @property
+    def full(self):
+        return self.maxsize is not None and len(self.tasks) >= self.maxsize
+
+    def push(self, task):
+        """Add a task to the queue.
+
+        @return: False, without adding the task, if the queue is full.
+        """
+        if self.full:
+            return False
+        self.tasks.append(task)
+        return True
+
+    def pop(self):
+        """Remove and return the oldest task.
+        """
+        return self.tasks.popleft()
+
+    def record(self, result):
+        """Count the result of a task run from the queue.
+        """
+        if result:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+
+class PriorityTaskQueue(TaskQueue):
+    """A bounded queue of tasks, popped in priority order.
+
+    Tasks with a lower priority number are popped first, and tasks of
+    the same priority in the order they were pushed. A task may have a
+    deadline, after which it is stale: stale tasks are dropped without
+    being run when they reach the head of the queue.
+
+    Use it with L{priority_queue}, L{queue} or L{parallel_queue}.
+
+    @ivar expired: The number of stale tasks dropped.
+    """
+    def __init__(self, maxsize=None, clock=time.time):
+        """
+        @keyword maxsize: The most tasks to hold. (Default: unbounded.)
+        @type maxsize: int
+
+        @keyword clock: The time function deadlines are measured by.
+        """
+        super(PriorityTaskQueue, self).__init__(maxsize)
+        self.tasks = []  # A heap of (priority, order, deadline, task)
+        self.clock = clock
+        self.expired = 0
+        self._order = count()
+        self._now = None  # The time of the last truth test, for pop().
+
+    def __nonzero__(self):
+        self._now = self._prune()
+        return bool(self.tasks)
+
+    def push(self, task, priority=0, deadline=None):
+        """Add a task to the queue.
+
+        @keyword priority: Lower numbers run first.
+
+        @keyword deadline: The time (by L{clock}) after which the task
+                           should no longer be run.
+
+        @return: False, without adding the task, if the queue is full.
+        """
+        if self.full:
+            return False
+        heappush(self.tasks, (priority, self._order.next(), deadline, task))
+        return True
+
+    def pop(self):
+        """Remove and return the most urgent task that isn't stale.
+
+        Staleness is judged at the time of the last truth test, if there
+        was one since the last pop, so that C{if queue: queue.pop()}
+        can't find the queue emptied in between.
+
+        @raise IndexError: if there are no such tasks.
+        """
+        now, self._now = self._now, None
+        self._prune(now)
+        return heappop(self.tasks)[3]
+
+    def _prune(self, now=None):
+        """Drop stale tasks from the head of the queue.
+
+        @return: The time they were judged by, or None if the clock
+                 wasn't read.
+        """
+        tasks = self.tasks
+        while tasks:
+            deadline = tasks[0][2]
+            if deadline is None:
+                break
+            if now is None:
+                now = self.clock()
+            if deadline >= now:
+                break
+            heappop(tasks)
+            self.expired += 1
+        return now
+
+
+def _runQueue(queue, kwargs):
+    record = getattr(queue, 'record', None)
+    while True:
+        if queue:
+            child = queue.pop()
+            result = yield child(**kwargs)
+            if record is not None:
+                record(result)
+        else:
+            yield None
+
+
 @parent_task
 def queue(queue, **kwargs):
     """Run tasks in the queue in sequence.
@@ -291,48 +1018,83 @@ def queue(queue, **kwargs):
     The queue should be an object implementing pop(). If the queue has
     items in it, it should evaluate to True, otherwise False. The
     queue task will pop the next task in the queue and evaluate it in
-    the normal fashion.
+    the normal fashion. If the queue has a C{record} method (as a
+    L{TaskQueue} does), it is called with each task's result.
 
     @param queue: task queue.
     @type queue: A sequence object implementing pop()
     """
-    while True:
-        if queue:
-            child = queue.pop()
-            yield child(**kwargs)
-        else:
-            yield None
+    return _runQueue(queue, kwargs)
+
+
+@parent_task
+def priority_queue(queue, **kwargs):
+    """Run tasks from a priority queue, most urgent first.
+
+    Like L{queue}, this runs one task at a time, and stalls while the
+    queue is empty. Each time a task finishes, the most urgent task
+    still queued runs next, so urgent tasks jump ahead of the backlog
+    without it being scanned, and tasks whose deadline has passed are
+    dropped without being run.
+
+    Note: the queue task *never* returns a success or failure code.
+
+    @param queue: task queue.
+    @type queue: L{PriorityTaskQueue}
+    """
+    return _runQueue(queue, kwargs)
 
 
 @parent_task
 def parallel_queue(queue, **kwargs):
     """Run tasks in the queue in parallel.
 
-    The queue will run each task in the queue in parallel. If the
-    queue is empty, it will stall until the queue receives new items.
+    Each iteration, tasks are taken from the queue and started (up to
+    C{max_running} running at once), and every running task is run
+    until it stalls or terminates. If the queue is empty, it will
+    stall until the queue receives new items.
 
     Note: the queue task *never* returns a success or failure code.
 
     The queue should be an object implementing pop(). If the queue has
-    items in it, it should evaluate to True, otherwise False. The
-    queue task will pop the next task in the queue and evaluate it in
-    the normal fashion.
+    items in it, it should evaluate to True, otherwise False. If the
+    queue has a C{record} method (as a L{TaskQueue} does), it is called
+    with each task's result.
 
     @param queue: task queue.
+
+    @keyword max_running: The most tasks to run at once. Tasks beyond
+                          this wait in the queue. (Default:
+                          unbounded.) Not to be confused with
+                          L{offload}'s C{max_in_flight}, which is
+                          passed on to the tasks.
+    @type max_running: int
     """
-    visits = []  # Canonical list of visited children
-    visiting = []  # Working list of visited children
-    while True:
-        if queue:
-            child = queue.pop()
-            visits.append(visit(child, **kwargs))
-        visiting[:] = visits  # Se we can remove from visits
-        for child in visiting:
-            try:
-                child.next()
-            except StopIteration:
-                visits.remove(child)
-        yield None
+    max_running = kwargs.pop('max_running', None)
+    record = getattr(queue, 'record', None)
+    running = deque()
+    try:
+        while True:
+            while queue and (max_running is None
+                           or len(running) < max_running):
+                running.append(visit(queue.pop(), **kwargs))
+            # Rotate through the running tasks once, retiring finished
+            # ones.
+            for x in xrange(len(running)):
+                child = running.popleft()
+                try:
+                    result = child.run_until_stall()
+                except StopIteration:
+                    result = False  # Terminated without a status.
+                if result is None:
+                    running.append(child)
+                elif record is not None:
+                    record(result)
+            yield None
+    finally:
+        # The queue only ends when it is closed: halt what's in flight.
+        for child in running:
+            child.close()
 
 
 @parent_task
@@ -357,6 +1119,387 @@ def selector(*children, **kwargs):
     yield final_value
 
 
+@parent_task
+def utilitySelector(*children, **kwargs):
+    """Run the child with the highest utility score.
+
+    Each child has a scoring function, and the child with the highest
+    score (the first, on a tie) is run. Scoring is the expensive part
+    of utility AI, so scores are only recomputed every C{interval}
+    ticks, or when one of the C{watch} keys is written on the
+    blackboard. If another child then scores highest, the running
+    child is abandoned, and the new winner is started. The selector
+    returns the status of whichever child terminates.
+
+    @param children: child tasks to select from.
+
+    @keyword scorers: One function per child, called with the run-time
+                      keyword arguments, returning the child's score.
+    @type scorers: sequence of callables
+
+    @keyword interval: Rescore every this many ticks. (Default: only
+                       when a watched key is written.)
+    @type interval: int
+
+    @keyword watch: Blackboard keys whose values the scores depend on.
+    @type watch: sequence
+    """
+    scorers = kwargs.pop('scorers')
+    interval = kwargs.pop('interval', None)
+    keys = kwargs.pop('watch', ())
+    if len(scorers) != len(children):
+        raise ValueError("utilitySelector needs one scorer per child")
+    bb = kwargs.get('blackboard')
+    dirty = [False]
+    armed = {}  # key -> callback, for the keys being watched
+
+    def changed(key):
+        armed.pop(key, None)  # Watches only fire once.
+        dirty[0] = True
+
+    def best():
+        for key in keys:
+            if key not in armed:
+                armed[key] = callback = partial(changed, key)
+                bb.watch(key, callback)
+        dirty[0] = False
+        winner = top = None
+        for index, scorer in enumerate(scorers):
+            score = scorer(**kwargs)
+            if winner is None or score > top:
+                winner, top = index, score
+        return winner
+
+    child = None
+    try:
+        current = best()
+        child = visit(children[current], **kwargs)
+        ticks = 0
+        while True:
+            if dirty[0] or (interval is not None and ticks >= interval):
+                ticks = 0
+                winner = best()
+                if winner != current:
+                    current = winner
+                    child.close()
+                    child = visit(children[current], **kwargs)
+            try:
+                result = child.run_until_stall()
+            except StopIteration:
+                result = False  # Terminated without a status.
+            if result is not None:
+                break
+            ticks += 1
+            yield None
+    finally:
+        if child is not None:
+            child.close()
+        for key, callback in armed.items():
+            bb.unwatch(key, callback)
+    yield result
+
+
+@parent_task
+def reactiveSelector(*children, **kwargs):
+    """Run the highest-priority child whose guard holds, switching as
+    soon as a higher-priority guard comes to hold.
+
+    Children are in priority order, each with a guard: a blackboard key
+    and a check of its value. Like L{selector}, the reactive selector
+    runs the first child whose guard holds, and moves on to the next
+    one if it fails. Unlike L{selector}, it rechecks the guards of the
+    higher-priority children every tick, and if one of them holds, it
+    runs that child, abandoning the running one unless the new child
+    fails on its first tick. The running child is also abandoned, as if
+    it had failed, if its own guard no longer holds.
+
+    A child that has failed is not tried again until its guard's key is
+    written; a child without a guard is not tried again at all.
+
+    Guard results are cached, and only checked again once their key has
+    been written on the blackboard, so rechecking costs next to nothing
+    while the blackboard is quiet.
+
+    @param children: child tasks to select from.
+
+    @keyword guards: One C{(key, check)} pair per child, where C{check}
+                     takes the value on the blackboard and returns a
+                     boolean, or None for a child that may always run.
+    @type guards: sequence
+
+    @keyword blackboard: The blackboard object.
+    """
+    guards = kwargs.pop('guards')
+    if len(guards) != len(children):
+        raise ValueError("reactiveSelector needs one guard per child")
+    bb = kwargs.get('blackboard')
+    count = len(children)
+    cache = [None] * count  # Guard results; None when unknown.
+    failed = [False] * count  # Children not to retry until rewritten.
+    watchers = {}  # key -> indexes of the guards on that key
+    for index, guard in enumerate(guards):
+        if guard is not None:
+            watchers.setdefault(guard[0], []).append(index)
+    armed = {}  # key -> callback, for the keys being watched
+
+    def changed(key):
+        armed.pop(key, None)  # Watches only fire once.
+        for index in watchers[key]:
+            cache[index] = None
+            failed[index] = False
+
+    def holds(index):
+        result = cache[index]
+        if result is None:
+            guard = guards[index]
+            if guard is None:
+                return True
+            key, check = guard
+            value = bb[key]  # Read before arming the watch.
+            if key not in armed:
+                armed[key] = callback = partial(changed, key)
+                bb.watch(key, callback)
+            result = cache[index] = bool(check(value))
+        return result
+
+    def first(start, stop):
+        for index in xrange(start, stop):
+            if not failed[index] and holds(index):
+                return index
+        return None
+
+    def step(visitor):
+        try:
+            return visitor.run_until_stall()
+        except StopIteration:
+            return False  # Terminated without a status.
+
+    final_value = False
+    child = None
+    try:
+        current = first(0, count)
+        while current is not None:
+            if child is None:
+                child = visit(children[current], **kwargs)
+                result = step(child)
+            else:
+                higher = first(0, current)
+                while higher is not None:
+                    # Give the higher child its tick before abandoning
+                    # the running one, in case it fails straight away.
+                    trial = visit(children[higher], **kwargs)
+                    result = step(trial)
+                    if result is not False:
+                        child.close()
+                        child, current = trial, higher
+                        break
+                    trial.close()
+                    failed[higher] = True
+                    higher = first(higher + 1, current)
+                else:
+                    if not holds(current):
+                        current = first(current + 1, count)
+                        child.close()
+                        child = None
+                        continue
+                    result = step(child)
+            if result:
+                final_value = True
+                break
+            elif result is None:
+                yield None
+            else:
+                failed[current] = True
+                current = first(current + 1, count)
+                child = None
+    finally:
+        if child is not None:
+            child.close()
+        for key, callback in armed.items():
+            bb.unwatch(key, callback)
+    yield final_value
+
+
+class AliasTable(object):
+    """Weights for choosing among children at random, in constant time.
+
+    Walker's alias method splits the weights into equal columns, each
+    holding at most two outcomes, so a choice takes one random number
+    and one comparison however many weights there are. The table is
+    built in linear time, when the tree is built, and only rebuilt by
+    L{update}.
+
+    @ivar weights: The weights the table was built from.
+    """
+    def __init__(self, weights):
+        """
+        @param weights: One non-negative weight per outcome.
+        @type weights: sequence of numbers
+        """
+        self.weights = []
+        self.update(weights)
+
+    def __len__(self):
+        return len(self.weights)
+
+    def update(self, weights):
+        """Rebuild the table with new weights.
+
+        Tasks built with this table use the new weights from their
+        next choice on.
+        """
+        weights = list(weights)
+        total = float(sum(weights))
+        if not weights or min(weights) < 0 or total <= 0:
+            raise ValueError("weights must be non-negative, "
+                             "with a positive sum: %r" % (weights,))
+        count = len(weights)
+        scaled = [w * count / total for w in weights]
+        probs = [1.0] * count
+        aliases = range(count)
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large[-1]
+            probs[less] = scaled[less]
+            aliases[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            if scaled[more] < 1.0:
+                small.append(large.pop())
+        # Anything left over is a full column, give or take rounding.
+        self.weights[:] = weights
+        self.probs = probs
+        self.aliases = aliases
+
+    def choose(self, rng=random):
+        """Return the index of an outcome, chosen by weight.
+
+        @keyword rng: A source of random numbers. (Default: the
+                      C{random} module.)
+        @type rng: L{random.Random}
+        """
+        roll = rng.random() * len(self.probs)
+        index = int(roll)
+        if roll - index < self.probs[index]:
+            return index
+        return self.aliases[index]
+
+
+def _weighted(children, table, rng):
+    """Yield the indexes of children in a weighted random order,
+    without repeats, skipping children with no weight.
+    """
+    if len(table) != len(children):
+        raise ValueError("a weighted task needs one weight per child")
+    weights = table.weights
+    remaining = len([w for w in weights if w > 0])
+    tried = set()
+    while remaining:
+        # Draw from the table until an untried child comes up. The
+        # first choice always takes one draw; once the untried
+        # children are rare, fall back to a linear draw among them.
+        for attempt in xrange(len(children)):
+            index = table.choose(rng)
+            if index not in tried:
+                break
+        else:
+            untried = [(i, w) for i, w in enumerate(weights)
+                       if w > 0 and i not in tried]
+            roll = rng.random() * sum(w for i, w in untried)
+            for index, weight in untried:
+                roll -= weight
+                if roll < 0:
+                    break
+        tried.add(index)
+        remaining -= 1
+        yield index
+
+
+def _tabled(func):
+    """Parent task decorator for weighted tasks.
+
+    Builds the C{weights} of each task into an L{AliasTable} once,
+    when the task is built, rather than every time it runs. The task
+    still records the plain weights, so it can be serialized.
+    """
+    factory = parent_task(func)
+
+    def initTask(*children, **initkwargs):
+        table = initkwargs.get('weights')
+        if table is None:
+            table = [1] * len(children)
+        if not isinstance(table, AliasTable):
+            table = AliasTable(table)
+        node = factory(*children, **dict(initkwargs, weights=table))
+        node.builder = initTask
+        node.initkwargs = dict(initkwargs, weights=table.weights)
+        return node
+    initTask.__doc__ = factory.__doc__
+    initTask.__name__ = factory.__name__
+    return initTask
+
+
+@_tabled
+def weightedSelector(*children, **kwargs):
+    """Run tasks in a weighted random order until one succeeds.
+
+    Each child is chosen with a probability in proportion to its
+    weight, from the children not yet tried. Children with no weight
+    are never run. Choosing the first child takes constant time, no
+    matter how many children there are; see L{AliasTable}.
+
+    @param children: child tasks to select from.
+
+    @keyword weights: One weight per child. (Default: equal weights.)
+                      Pass an L{AliasTable} to share it between trees,
+                      or to L{update<AliasTable.update>} it later.
+    @type weights: sequence of numbers, or L{AliasTable}
+
+    @keyword rng: A source of random numbers. (Default: the C{random}
+                  module.)
+    @type rng: L{random.Random}
+    """
+    table = kwargs.pop('weights')
+    rng = kwargs.pop('rng', random)
+    final_value = False
+    for index in _weighted(children, table, rng):
+        result = (yield children[index](**kwargs))
+        if result:
+            final_value = True
+            break
+
+    yield final_value
+
+
+@_tabled
+def weightedSequence(*children, **kwargs):
+    """Run tasks in a weighted random order until one fails.
+
+    As with L{weightedSelector}, children are chosen in proportion to
+    their weights, and children with no weight are never run.
+
+    @param children: tasks to run in sequence as children.
+
+    @keyword weights: One weight per child. (Default: equal weights.)
+    @type weights: sequence of numbers, or L{AliasTable}
+
+    @keyword rng: A source of random numbers. (Default: the C{random}
+                  module.)
+    @type rng: L{random.Random}
+    """
+    table = kwargs.pop('weights')
+    rng = kwargs.pop('rng', random)
+    final_value = True
+    for index in _weighted(children, table, rng):
+        result = yield children[index](**kwargs)
+        if not result and result is not None:
+            final_value = False
+            break
+
+    yield final_value
+
+
 class Enum(object):
     """Enum/namespace class. Cannot be implemented. 
 
@@ -380,8 +1523,12 @@ class PARALLEL_SUCCESS(Enum):
 def parallel(*children, **kwargs):
     """Run tasks in parallel until the success policy is fulfilled or broken.
 
-    If the success policy is met, return a success. If the policy is
-    broken, return a failure.
+    Each iteration, every running child is run until it stalls or
+    terminates (see L{Visitor.run_until_stall}). Children are judged
+    by their termination status, and a child that has terminated is
+    not run again. The parallel terminates as soon as its outcome is
+    decided: when enough children have succeeded, when enough have
+    failed, or when too few are left to succeed.
 
     For more information, see the discussion at
     U{aigamedev.com/hierarchical-logic/parallel}.
@@ -392,31 +1539,65 @@ def parallel(*children, **kwargs):
                    or only one must succeed.
     @type policy: C{PARALLEL_SUCCESS.REQUIRE_ALL} or 
                   C{PARALLEL_SUCCESS.REQUIRE_ONE}.
+
+    @keyword successes: Succeed once this many children have
+                        succeeded. (Default: all children for
+                        C{REQUIRE_ALL}, one for C{REQUIRE_ONE}.)
+    @type successes: int
+
+    @keyword failures: Fail once this many children have
+                       failed. (Default: one for C{REQUIRE_ALL}, all
+                       children for C{REQUIRE_ONE}.)
+    @type failures: int
     """
-    return_values = set((True, False))
     policy = kwargs.pop('policy', PARALLEL_SUCCESS.REQUIRE_ONE)
-    all_must_succeed = (policy == PARALLEL_SUCCESS.REQUIRE_ALL)
-    visits = [visit(arg, **kwargs) for arg in children]
-    final_value = True
-    while True:
-        try:
-            # Run one step on each child per iteration.
-            for child in visits:
-                result = child.next()
-                if result in return_values:
-                    if not result and all_must_succeed:
-                        final_value = False
-                        break
-                    elif result and not all_must_succeed:
-                        final_value = True
-                        break
-                    else:
-                        final_value = result
-            yield None
-        except StopIteration:
-            break
-        except EmptyError:
-            break
+    if policy == PARALLEL_SUCCESS.REQUIRE_ALL:
+        successes, failures = len(children), 1
+    else:
+        successes, failures = 1, len(children)
+    successes = kwargs.pop('successes', successes)
+    failures = kwargs.pop('failures', failures)
+
+    pending = len(children)  # Children that haven't terminated
+    succeeded = failed = 0
+    final_value = None
+    if successes <= 0:
+        final_value = True
+    elif pending < successes:
+        final_value = False
+    active = [visit(child, **kwargs) for child in children]
+    try:
+        while final_value is None:
+            running = 0
+            for child in active:
+                try:
+                    result = child.run_until_stall()
+                except StopIteration:
+                    result = False  # Terminated without a status.
+                if result is None:
+                    # Still running: keep it, compacting the list in place.
+                    active[running] = child
+                    running += 1
+                    continue
+                pending -= 1
+                if result:
+                    succeeded += 1
+                else:
+                    failed += 1
+                if succeeded >= successes:
+                    final_value = True
+                    break
+                if failed >= failures or succeeded + pending < successes:
+                    final_value = False
+                    break
+            else:
+                del active[running:]
+                yield None
+    finally:
+        # Halt the children still running once the policy is decided
+        # (or the parallel itself is closed).
+        for child in active:
+            child.close()
     yield final_value
 
 
@@ -464,8 +1645,13 @@ def catch(child, **kwargs):
             result = tree.next()
             yield None
     except caught:
+        # The exception left the child's parents suspended; halt them
+        # before switching to the branch.
+        tree.close()
         while result is None:
             result = (yield branch(**kwargs))
+    finally:
+        tree.close()
     yield result
 
 
@@ -48,17 +48,24 @@ def repeatAlways(child, **kwargs):
     """Perpetually iterate over the child, regardless of return value.
     """
     result = None
-    while True:
-        try:
-            visitor = core.visit(child, **kwargs)
-        except StopIteration:
-            continue
-        while result is None:
+    visitor = None
+    try:
+        while True:
+            if visitor is not None:
+                visitor.close()
             try:
-                result = (yield visitor.next())
+                visitor = core.visit(child, **kwargs)
             except StopIteration:
-                yield None
-                break
+                continue
+            while result is None:
+                try:
+                    result = (yield visitor.next())
+                except StopIteration:
+                    yield None
+                    break
+    finally:
+        if visitor is not None:
+            visitor.close()
         
 
 @core.parent_task
@@ -70,10 +77,10 @@ def repeatUntilFail(child, **kwargs):
     """
     final_value = kwargs.pop('final_value', False)
     result = None
-    child = child(**kwargs)
     while result is None:
         try:
-            result = (yield child)
+            # Run a fresh instance of the child each time around.
+            result = (yield child(**kwargs))
             if result is False:
                 break
             else:
@@ -92,10 +99,10 @@ def repeatUntilSucceed(child, **kwargs):
     """
     final_value = kwargs.pop('final_value', True)
     result = None
-    child = child(**kwargs)
     while result is None:
         try:
-            result = (yield child)
+            # Run a fresh instance of the child each time around.
+            result = (yield child(**kwargs))
             if result is True:
                 break
             else:
@@ -118,12 +125,15 @@ def limit(child, **kwargs):
     period = kwargs.get('limit_period', 1.0)
     result = None
     visitor = core.visit(child, **kwargs)
-    while True:
-        now = nowtime()
-        since_last = now - last_run
-        if (since_last) <= period:
-            yield None
-            continue
-        last_run = nowtime()
-        result = visitor.next()
-        yield result
+    try:
+        while True:
+            now = nowtime()
+            since_last = now - last_run
+            if (since_last) <= period:
+                yield None
+                continue
+            last_run = nowtime()
+            result = visitor.next()
+            yield result
+    finally:
+        visitor.close()
@@ -1,3 +1,219 @@
 # -*- coding: utf-8 -*-
 """owyl.dsl -- a domain-specific language (based on YAML) for behavior trees.
+
+A tree is written as nested nodes. A node is either the name of a
+task, or a mapping of one task name to its arguments: a list of child
+nodes, a mapping of keyword arguments (with the child nodes, if any,
+under C{children}), or a single plain value to pass as the task's
+first argument (such as the message of a L{log<owyl.core.log>})::
+
+    selector:
+      - sequence:
+          - checkBB: {key: enemy}
+          - setBB: {key: state, value: fleeing}
+      - parallel:
+          policy: ALL
+          children:
+            - succeed
+            - log: "Nothing to do."
+
+In keyword arguments, a string starting with C{$} names an object in
+the registry (write C{$$} for a literal C{$}), and a mapping of
+C{$tree} to a node is a subtree::
+
+    catch:
+      caught: $ValueError
+      branch: {$tree: fail}
+      children: [eat]
+
+Task names are looked up in a L{Registry<owyl.registry.Registry>},
+the L{default<owyl.registry.default>} one unless another is given, so
+custom tasks can be used once they are registered.
+
+L{compile} builds a tree from data that is already parsed (from YAML,
+JSON, or plain Python). L{loads} and L{loadFile} parse YAML text (or,
+without PyYAML, JSON, which is a subset of YAML), and cache the
+compiled tree by the hash of the text: loading the same tree again,
+for every agent spawned, is only a lookup, and L{loadFile} picks up
+changes to the file as soon as they are made. The cache keeps the
+L{CACHE_SIZE} trees used most recently, and a reloaded file's new
+tree replaces its old one.
+
+YAML needs PyYAML, which is installed with the C{dsl} extra::
+
+    $ pip install owyl[dsl]
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
 """
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import os
+from collections import OrderedDict
+from hashlib import sha1
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+    import json
+
+import registry as _registry
+
+__all__ = ['compile', 'loads', 'loadFile', 'clearCache', 'DSLError',
+           'CACHE_SIZE']
+
+CACHE_SIZE = 256
+
+_cache = OrderedDict()  # (sha1 of the text, registry) -> tree, oldest first
+_files = {}  # (path, registry) -> ((mtime, size), cache key, tree)
+
+
+class DSLError(ValueError):
+    """A tree definition is malformed.
+    """
+    pass
+
+
+def compile(data, registry=None):
+    """Build a tree from parsed data.
+
+    @param data: The root node.
+
+    @keyword registry: The registry to look up names in.
+    @type registry: L{Registry<owyl.registry.Registry>}
+    """
+    if registry is None:
+        registry = _registry.default
+    return _node(data, registry, 'tree')
+
+
+def _lookup(name, registry, path):
+    try:
+        return registry[name]
+    except KeyError:
+        raise DSLError("%s: unknown name %r" % (path, name))
+
+
+def _node(data, registry, path):
+    if isinstance(data, basestring):
+        name, body = data, None
+    elif isinstance(data, dict) and len(data) == 1:
+        (name, body), = data.items()
+    else:
+        raise DSLError("%s: a node must be a task name, or a mapping of "
+                       "one task name to its arguments, not %r"
+                       % (path, data))
+    name = str(name)
+    path = '%s.%s' % (path, name)
+    builder = _lookup(name, registry, path)
+    args = []
+    kwargs = {}
+    if isinstance(body, list):
+        args = [_node(child, registry, '%s[%d]' % (path, i))
+                for i, child in enumerate(body)]
+    elif isinstance(body, dict):
+        for key, value in body.iteritems():
+            key = str(key)
+            if key == 'children':
+                if not isinstance(value, list):
+                    raise DSLError("%s: children must be a list" % path)
+                args = [_node(child, registry, '%s[%d]' % (path, i))
+                        for i, child in enumerate(value)]
+            else:
+                kwargs[key] = _value(value, registry,
+                                     '%s.%s' % (path, key))
+    elif body is not None:
+        args = [_value(body, registry, path)]
+    return builder(*args, **kwargs)
+
+
+def _value(value, registry, path):
+    if isinstance(value, basestring):
+        if value.startswith('$$'):
+            return value[1:]
+        if value.startswith('$'):
+            return _lookup(str(value[1:]), registry, path)
+        return value
+    if isinstance(value, list):
+        return [_value(item, registry, path) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1 and '$tree' in value:
+            return _node(value['$tree'], registry, path)
+        return dict((key, _value(item, registry, path))
+                    for key, item in value.iteritems())
+    return value
+
+
+def _parse(text):
+    if yaml is not None:
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        return yaml.load(text, Loader=loader)
+    try:
+        return json.loads(text)
+    except ValueError, e:
+        raise DSLError("PyYAML isn't installed, and the text isn't "
+                       "JSON: %s" % e)
+
+
+def loads(text, registry=None):
+    """Build a tree from YAML text, or return the cached tree if the
+    same text was loaded before.
+    """
+    if registry is None:
+        registry = _registry.default
+    return _load(text, registry)[1]
+
+
+def _load(text, registry):
+    """Return the cache key and the tree for the text.
+    """
+    key = (sha1(text).hexdigest(), registry)
+    try:
+        tree = _cache.pop(key)
+    except KeyError:
+        tree = compile(_parse(text), registry)
+        while len(_cache) >= CACHE_SIZE:
+            _cache.popitem(last=False)
+    _cache[key] = tree  # Now the most recently used.
+    return key, tree
+
+
+def loadFile(path, registry=None):
+    """Build a tree from a YAML file.
+
+    The file is only read again when its modification time or size
+    changes, and only compiled again when its contents do.
+    """
+    if registry is None:
+        registry = _registry.default
+    stat = os.stat(path)
+    version = (stat.st_mtime, stat.st_size)
+    key = (path, registry)
+    entry = _files.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[2]
+    stream = open(path, 'rb')
+    try:
+        text = stream.read()
+    finally:
+        stream.close()
+    cached, tree = _load(text, registry)
+    if entry is not None and entry[1] != cached:
+        # Forget the file's old revision.
+        _cache.pop(entry[1], None)
+    _files[key] = (version, cached, tree)
+    return tree
+
+
+def clearCache():
+    """Forget all compiled trees.
+    """
+    _cache.clear()
+    _files.clear()
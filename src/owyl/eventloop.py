@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""eventloop -- run Owyl behavior trees on an event loop.
+
+A L{LoopRunner} ticks a L{TreeScheduler<owyl.scheduler.TreeScheduler>}
+from an event loop such as C{asyncio}'s. Leaves built with
+L{async_task<owyl.core.async_task>} park their agents on futures, so
+agents waiting on I/O cost nothing until their futures are done, and
+the runner stops ticking altogether while every agent is waiting.
+
+    >>> scheduler = TreeScheduler()
+    >>> scheduler.add(tree, blackboard=bb)
+    >>> runner = LoopRunner(scheduler, loop, interval=1/30.0)
+    >>> runner.start()
+    >>> loop.run_forever()
+
+Any loop implementing C{call_soon()} and C{call_later()} will do;
+C{call_soon_threadsafe()} is used where available.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+__all__ = ['LoopRunner']
+
+
+class LoopRunner(object):
+    """Tick a tree scheduler from an event loop.
+
+    While any agent is runnable, the scheduler is ticked every
+    C{interval} seconds. When every agent is parked or finished, the
+    runner goes idle until an agent is woken.
+
+    @ivar stats: The L{TickStats<owyl.scheduler.TickStats>} of the
+                 last tick.
+    """
+    def __init__(self, scheduler, loop, interval=0.0):
+        self.scheduler = scheduler
+        self.loop = loop
+        self.interval = interval
+        self.running = False
+        self.stats = None
+        self._scheduled = False
+        self._handle = None
+        self._call_soon = getattr(loop, 'call_soon_threadsafe',
+                                  loop.call_soon)
+
+    def start(self):
+        """Start ticking the scheduler.
+        """
+        self.running = True
+        self.scheduler.onwake = self.schedule
+        self.schedule()
+
+    def stop(self):
+        """Stop ticking the scheduler.
+        """
+        self.running = False
+        self.scheduler.onwake = None
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._scheduled = False
+
+    def schedule(self):
+        """Tick the scheduler as soon as possible.
+
+        Safe to call from any thread.
+        """
+        if self.running and not self._scheduled:
+            self._scheduled = True
+            self._handle = self._call_soon(self._tick)
+
+    def _tick(self):
+        self._scheduled = False
+        self._handle = None
+        if not self.running:
+            return
+        self.stats = self.scheduler.tick()
+        if self.scheduler.pending and not self._scheduled:
+            self._scheduled = True
+            self._handle = self.loop.call_later(self.interval, self._tick)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""flyweight -- tree definitions shared by many agents.
+
+A tree definition (the nested task factories returned by the builders)
+holds no running state, so one definition can be run by any number of
+agents. The per-agent state is only what C{visit} allocates: the
+visitor, and the generators of the running nodes.
+
+To share a definition, build it without binding it to an agent: write
+its behaviors with L{agentmethod<owyl.core.agentmethod>} (or as plain
+L{task<owyl.core.task>}s), and pass the agent and its values at run
+time. L{shared} makes a builder build each tree only once, and a
+L{Flyweight} instantiates a definition for an agent:
+
+    >>> class Boid(object):
+    ...     @classmethod
+    ...     @shared
+    ...     def buildTree(cls):
+    ...         return owyl.sequence(cls.move(), cls.seek(rate=5))
+    ...
+    >>> flyweight = Flyweight(Boid.buildTree())
+    >>> visitor = flyweight.instantiate(agent=boid, blackboard=bb)
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import core
+import nodes
+from optimize import optimize as optimizeTree
+
+__all__ = ['shared', 'Flyweight']
+
+
+def shared(builder):
+    """Tree builder decorator.
+
+    The decorated builder builds a tree once for each distinct set of
+    (hashable) arguments, and returns the same tree after that.
+    """
+    cache = {}
+
+    def build(*args):
+        try:
+            return cache[args]
+        except KeyError:
+            tree = cache[args] = builder(*args)
+            return tree
+    build.cache = cache
+    try: build.__name__ = builder.__name__
+    except AttributeError: pass
+    try: build.__doc__ = builder.__doc__
+    except AttributeError: pass
+    return build
+
+
+class Flyweight(object):
+    """A tree definition, instantiated for many agents.
+
+    @ivar instances: The number of instances created.
+    """
+    def __init__(self, tree, optimize=False):
+        """
+        @param tree: The tree definition.
+
+        @keyword optimize: Run the tree through the
+                           L{optimizer<owyl.optimize>} first. This is
+                           done once, for all agents.
+        @type optimize: bool
+        """
+        if optimize:
+            tree = optimizeTree(tree)
+        self.tree = tree
+        self.instances = 0
+        self._nodes = isinstance(tree, nodes.NodeFactory)
+
+    def instantiate(self, **kwargs):
+        """Return a running instance of the tree for one agent.
+
+        For core trees, this is a L{Visitor<owyl.core.Visitor>}; for
+        L{owyl.nodes} trees, it is the root node.
+
+        @keyword agent: The agent, for
+                        L{agentmethod<owyl.core.agentmethod>} behaviors.
+        """
+        self.instances += 1
+        if self._nodes:
+            return self.tree(**kwargs)
+        return core.visit(self.tree, **kwargs)
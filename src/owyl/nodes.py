@@ -0,0 +1,575 @@
+# -*- coding: utf-8 -*-
+"""nodes -- an explicit-state execution engine for Owyl.
+
+The core engine implements behaviors as nested generators, trampolined
+by L{visit<owyl.core.visit>}. This module provides an alternative
+engine in which each behavior is a L{Node} object holding its own
+resumable state, with a L{tick<Node.tick>} method that returns one of
+the termination status values:
+
+  - B{SUCCESS} (C{True})
+  - B{FAILURE} (C{False})
+  - B{RUNNING} (C{None})
+
+A tick runs the node as far as it can go, descending directly into
+its children, and returns as soon as the node either terminates or
+has a running child. No generators are resumed and no exceptions are
+raised for control flow.
+
+Trees are built exactly as with the core engine, by nesting the
+constructor calls:
+
+    >>> from owyl import nodes
+    >>> tree = nodes.sequence(nodes.checkBB(key='enemy'),
+    ...                       nodes.setBB(key='alarm', value=True))
+    >>> root = tree(blackboard=bb)
+    >>> status = root.tick()
+
+Generator-based tasks (those built with L{task<owyl.core.task>} and
+friends) may be used as children; they are run by a L{TaskNode}.
+Likewise, a node may be used anywhere the core engine expects an
+iterator, as nodes also implement the iterator protocol.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import time
+
+import core
+
+__all__ = ['SUCCESS', 'FAILURE', 'RUNNING',
+           'Node', 'NodeFactory', 'TaskNode', 'builder',
+           'succeed', 'fail', 'succeedAfter', 'failAfter', 'wrap',
+           'sequence', 'selector', 'parallel',
+           'identity', 'flip', 'repeatAlways', 'repeatUntilFail',
+           'repeatUntilSucceed', 'limit',
+           'checkBB', 'setBB']
+
+SUCCESS = True
+FAILURE = False
+RUNNING = None
+
+
+class NodeFactory(object):
+    """A node definition: the node class, its children and its
+    initialization keyword arguments.
+
+    Calling the factory with run-time keyword arguments instantiates
+    the node (and its children) with its own running state, just as
+    calling a core task factory produces a fresh iterator.
+    """
+    def __init__(self, cls, name, children, initkwargs, params=()):
+        self.cls = cls
+        self.__name__ = name
+        self.__doc__ = cls.__doc__
+        self.children = children
+        self.initkwargs = initkwargs
+        self.params = params
+
+    def __call__(self, **runkwargs):
+        runkwargs.update(self.initkwargs)
+        return self.cls(self, runkwargs)
+
+
+def builder(cls, name=None):
+    """Make a tree-building function for the given L{Node} subclass.
+
+    The builder accepts children as positional arguments and
+    initialization keyword arguments, and returns a L{NodeFactory}.
+    """
+    name = name or cls.__name__
+
+    def initNode(*children, **initkwargs):
+        return NodeFactory(cls, name, children, initkwargs)
+    initNode.__name__ = name
+    initNode.__doc__ = cls.__doc__
+    return initNode
+
+
+def instantiate(child, kwargs):
+    """Instantiate a child definition as a node.
+
+    Core task factories are wrapped in a L{TaskNode}.
+    """
+    if isinstance(child, NodeFactory):
+        return child(**kwargs)
+    return TaskNode(child, kwargs)
+
+
+class Node(object):
+    """Base class for explicit-state behavior nodes.
+
+    Subclasses implement L{tick}, L{reset} if they hold state beyond
+    their children, and L{configure} if they read parameters from
+    their keyword arguments.
+
+    @cvar keywords: Keyword arguments consumed by this node, which are
+                    not passed on to its children.
+    """
+    keywords = ()
+
+    def __init__(self, factory, kwargs):
+        self.factory = factory
+        self.kwargs = kwargs
+        self.stopped = False
+        self.configure()
+        kwargs = self.childKwargs()
+        self.children = [instantiate(c, kwargs) for c in factory.children]
+
+    def childKwargs(self):
+        """Return the keyword arguments to pass on to children.
+        """
+        kwargs = self.kwargs
+        if self.keywords:
+            kwargs = kwargs.copy()
+            for key in self.keywords:
+                kwargs.pop(key, None)
+        return kwargs
+
+    def configure(self):
+        """Read parameters from the node's keyword arguments.
+        """
+        pass
+
+    def bind(self, runkwargs):
+        """Reset the node and its children with new run-time keyword
+        arguments, as if the factory had been called with them.
+
+        This lets a node tree be recycled without reallocating it.
+        """
+        kwargs = dict(runkwargs)
+        kwargs.update(self.factory.initkwargs)
+        self.kwargs = kwargs
+        self.reset()
+        self.configure()
+        kwargs = self.childKwargs()
+        for child in self.children:
+            child.bind(kwargs)
+
+    @property
+    def __name__(self):
+        return self.factory.__name__
+
+    def tick(self):
+        """Run the node. Return SUCCESS, FAILURE, or RUNNING.
+        """
+        raise NotImplementedError
+
+    def reset(self):
+        """Return the node (and its children) to its initial state.
+        """
+        self.stopped = False
+        for child in self.children:
+            child.reset()
+
+    def close(self):
+        """Halt the node, closing any core tasks running beneath it.
+        """
+        self.reset()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """Tick the node as an iterator, for use with the core engine.
+        """
+        if self.stopped:
+            raise StopIteration
+        result = self.tick()
+        if result is not RUNNING:
+            self.stopped = True
+        return result
+
+
+class TaskNode(Node):
+    """Run a core (generator-based) task as a node.
+
+    The task's termination status is the last status it yielded.
+    """
+    def __init__(self, task, kwargs):
+        self.task = task
+        self.kwargs = kwargs
+        self.children = ()
+        self.stopped = False
+        self.visitor = None
+        self.result = None
+
+    @property
+    def __name__(self):
+        return getattr(self.task, '__name__', 'task')
+
+    def tick(self):
+        if self.visitor is None:
+            self.visitor = core.visit(self.task, **self.kwargs)
+        step = self.visitor.next
+        while True:
+            try:
+                result = step()
+            except StopIteration:
+                result = self.result
+                self.visitor = self.result = None
+                return bool(result)
+            if result is None:
+                return RUNNING
+            self.result = result
+
+    def reset(self):
+        self.stopped = False
+        if self.visitor is not None:
+            self.visitor.close()
+        self.visitor = self.result = None
+
+    def bind(self, runkwargs):
+        self.kwargs = runkwargs
+        self.reset()
+
+
+### Leaves
+##########
+
+class Succeed(Node):
+    """Always succeed.
+    """
+    def tick(self):
+        return SUCCESS
+
+
+class Fail(Node):
+    """Always fail.
+    """
+    def tick(self):
+        return FAILURE
+
+
+class SucceedAfter(Node):
+    """Succeed after a given number of iterations.
+
+    Returns RUNNING 'after' times.
+
+    @keyword after: How many iterations to succeed after.
+    @type after: int
+    """
+    result = SUCCESS
+
+    def __init__(self, factory, kwargs):
+        super(SucceedAfter, self).__init__(factory, kwargs)
+        self.count = 0
+
+    def configure(self):
+        self.after = self.kwargs.get('after', 1)
+
+    def tick(self):
+        if self.count < self.after:
+            self.count += 1
+            return RUNNING
+        self.count = 0
+        return self.result
+
+    def reset(self):
+        super(SucceedAfter, self).reset()
+        self.count = 0
+
+
+class FailAfter(SucceedAfter):
+    """Fail after a given number of iterations.
+
+    Returns RUNNING 'after' times.
+
+    @keyword after: How many iterations to fail after.
+    @type after: int
+    """
+    result = FAILURE
+
+
+class Wrap(Node):
+    """Wrap a callable as a node. Return the boolean of its result.
+    """
+    def tick(self):
+        func, args, kwargs = self.factory.params
+        return bool(func(*args, **kwargs))
+
+
+def wrap(func, *args, **kwargs):
+    """Wrap a callable as a node. Return the boolean of its result.
+    """
+    name = getattr(func, '__name__', 'wrap')
+
+    def initNode(**initkwargs):
+        return NodeFactory(Wrap, name, (), initkwargs, (func, args, kwargs))
+    initNode.__name__ = name
+    initNode.__doc__ = getattr(func, '__doc__', None)
+    return initNode
+
+
+### Composites
+##############
+
+class Sequence(Node):
+    """Run children in sequence until one fails.
+
+    If a child fails, fail. If all succeed, succeed.
+    """
+    def __init__(self, factory, kwargs):
+        super(Sequence, self).__init__(factory, kwargs)
+        self.index = 0
+
+    def tick(self):
+        children = self.children
+        while self.index < len(children):
+            result = children[self.index].tick()
+            if result is RUNNING:
+                return RUNNING
+            if not result:
+                self.index = 0
+                return FAILURE
+            self.index += 1
+        self.index = 0
+        return SUCCESS
+
+    def reset(self):
+        super(Sequence, self).reset()
+        self.index = 0
+
+
+class Selector(Sequence):
+    """Run children in sequence until one succeeds.
+
+    If a child succeeds, succeed. If all fail, fail.
+    """
+    def tick(self):
+        children = self.children
+        while self.index < len(children):
+            result = children[self.index].tick()
+            if result is RUNNING:
+                return RUNNING
+            if result:
+                self.index = 0
+                return SUCCESS
+            self.index += 1
+        self.index = 0
+        return FAILURE
+
+
+class Parallel(Node):
+    """Tick all children each tick until the success policy is
+    fulfilled or broken.
+
+    As with the core parallel, children are judged by their
+    termination status, finished children are not ticked again, and
+    the policy may be given as thresholds.
+
+    @keyword policy: The success policy. All must succeed,
+                   or only one must succeed.
+    @type policy: C{PARALLEL_SUCCESS.REQUIRE_ALL} or
+                  C{PARALLEL_SUCCESS.REQUIRE_ONE}.
+
+    @keyword successes: Succeed once this many children have
+                        succeeded. (Default: set by the policy.)
+    @keyword failures: Fail once this many children have failed.
+                       (Default: set by the policy.)
+    """
+    keywords = ('policy', 'successes', 'failures')
+
+    def __init__(self, factory, kwargs):
+        super(Parallel, self).__init__(factory, kwargs)
+        self.active = list(self.children)
+        self.succeeded = self.failed = 0
+
+    def configure(self):
+        kwargs = self.kwargs
+        policy = kwargs.get('policy', core.PARALLEL_SUCCESS.REQUIRE_ONE)
+        count = len(self.factory.children)
+        if policy == core.PARALLEL_SUCCESS.REQUIRE_ALL:
+            successes, failures = count, 1
+        else:
+            successes, failures = 1, count
+        self.successes = kwargs.get('successes', successes)
+        self.failures = kwargs.get('failures', failures)
+
+    def tick(self):
+        active = self.active
+        successes = self.successes
+        if successes <= 0:
+            return SUCCESS
+        if len(active) < successes - self.succeeded:
+            self.reset()
+            return FAILURE
+        total = len(self.children)
+        running = 0
+        for child in active:
+            result = child.tick()
+            if result is RUNNING:
+                active[running] = child
+                running += 1
+                continue
+            if result:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            if self.succeeded >= successes:
+                self.reset()
+                return SUCCESS
+            if (self.failed >= self.failures
+                or total - self.failed < successes):
+                # Too many have failed for the rest to make up.
+                self.reset()
+                return FAILURE
+        del active[running:]
+        return RUNNING
+
+    def reset(self):
+        super(Parallel, self).reset()
+        self.active[:] = self.children
+        self.succeeded = self.failed = 0
+
+
+### Decorators
+##############
+
+class Identity(Node):
+    """Transparent decorator. Pass the child's status unchanged.
+    """
+    def tick(self):
+        return self.children[0].tick()
+
+
+class Flip(Node):
+    """NOT decorator. Pass the child's status with the boolean flipped.
+
+    RUNNING is passed unchanged.
+    """
+    def tick(self):
+        result = self.children[0].tick()
+        if result is RUNNING:
+            return RUNNING
+        return not result
+
+
+class RepeatAlways(Node):
+    """Perpetually tick the child, regardless of its status.
+    """
+    def tick(self):
+        self.children[0].tick()
+        return RUNNING
+
+
+class RepeatUntilFail(Node):
+    """Repeatedly tick the child until it fails.
+
+    @keyword final_value: Value to return on failure.
+    @type final_value: C{True} or C{False}
+    """
+    keywords = ('final_value',)
+    until = FAILURE
+    default = False
+
+    def configure(self):
+        self.final_value = self.kwargs.get('final_value', self.default)
+
+    def tick(self):
+        if self.children[0].tick() is self.until:
+            return self.final_value
+        return RUNNING  # Yield to other tasks.
+
+
+class RepeatUntilSucceed(RepeatUntilFail):
+    """Repeatedly tick the child until it succeeds.
+
+    @keyword final_value: Value to return on success.
+    @type final_value: C{True} or C{False}
+    """
+    until = SUCCESS
+    default = True
+
+
+class Limit(Node):
+    """Limit the child to only tick once every period.
+
+    Otherwise, act as an identity decorator.
+
+    @keyword limit_period: how often to run the child, in seconds.
+    """
+    def __init__(self, factory, kwargs):
+        super(Limit, self).__init__(factory, kwargs)
+        self.last_run = time.time()
+
+    def configure(self):
+        self.period = self.kwargs.get('limit_period', 1.0)
+
+    def tick(self):
+        now = time.time()
+        if now - self.last_run <= self.period:
+            return RUNNING
+        self.last_run = now
+        return self.children[0].tick()
+
+    def reset(self):
+        super(Limit, self).reset()
+        self.last_run = time.time()
+
+
+### Blackboard
+##############
+
+class CheckBB(Node):
+    """Check a value on the blackboard.
+
+    @keyword blackboard: The blackboard object.
+
+    @keyword key: The name of a key on the blackboard.
+    @type key: A hashable object
+
+    @keyword check: A function that takes the value on the blackboard
+                    and returns a boolean.
+    """
+    def tick(self):
+        kwargs = self.kwargs
+        value = kwargs['blackboard'][kwargs['key']]
+        check = kwargs.get('check')
+        if check is None:
+            return value is not None
+        return check(value) and True or False  # Always return a boolean.
+
+
+class SetBB(Node):
+    """Set a value on the blackboard.
+
+    @keyword blackboard: The blackboard object.
+
+    @keyword key: The name of a key on the blackboard.
+    @type key: A hashable object
+
+    @keyword value: The value to set on the key.
+    """
+    def tick(self):
+        kwargs = self.kwargs
+        kwargs['blackboard'][kwargs['key']] = kwargs['value']
+        return SUCCESS
+
+
+succeed = builder(Succeed, 'succeed')
+fail = builder(Fail, 'fail')
+succeedAfter = builder(SucceedAfter, 'succeedAfter')
+failAfter = builder(FailAfter, 'failAfter')
+
+sequence = builder(Sequence, 'sequence')
+selector = builder(Selector, 'selector')
+parallel = builder(Parallel, 'parallel')
+
+identity = builder(Identity, 'identity')
+flip = builder(Flip, 'flip')
+repeatAlways = builder(RepeatAlways, 'repeatAlways')
+repeatUntilFail = builder(RepeatUntilFail, 'repeatUntilFail')
+repeatUntilSucceed = builder(RepeatUntilSucceed, 'repeatUntilSucceed')
+limit = builder(Limit, 'limit')
+
+checkBB = builder(CheckBB, 'checkBB')
+setBB = builder(SetBB, 'setBB')
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""optimize -- a static optimizer for Owyl behavior trees.
+
+Trees often contain structure that can be taken out without changing
+what they do. L{optimize} takes a built tree and returns an
+equivalent, smaller one, which creates fewer generators and takes
+fewer visitor steps every time it is run:
+
+    >>> tree = optimize(buildTree())
+    >>> visitor = visit(tree, blackboard=bb)
+
+The rewrites are:
+
+  - C{identity(x)} becomes C{x}.
+  - C{flip(flip(x))} becomes C{x}.
+  - C{sequence(x)} and C{selector(x)} become C{x}.
+  - C{succeed()} children are dropped from sequences, and C{fail()}
+    children from selectors.
+  - Sequences nested directly in sequences, and selectors in
+    selectors, are flattened into their parent.
+
+The results the tree yields are unchanged, but since fewer nodes run,
+it may finish in fewer steps. A node built with keyword arguments is
+never removed, since its children may depend on them. Nodes that
+weren't built by the L{task<owyl.core.task>} family of decorators
+(such as L{owyl.nodes} trees) are left as they are.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import core
+import decorators
+
+__all__ = ['optimize', 'size']
+
+
+def size(tree):
+    """Return the number of task nodes in a tree.
+    """
+    if getattr(tree, 'builder', None) is None:
+        return 1
+    return 1 + sum([size(child) for child in tree.children
+                    if callable(child)])
+
+
+def optimize(tree):
+    """Return an equivalent tree with removable nodes taken out.
+
+    Subtrees that don't change are shared with the original tree.
+    """
+    return _optimize(tree, {})
+
+
+def _isPlain(node, builder):
+    """Is the node built by the builder, with no keyword arguments?
+    """
+    return (getattr(node, 'builder', None) is builder
+            and not node.initkwargs)
+
+
+def _optimize(node, memo):
+    try:
+        return memo[id(node)][1]
+    except KeyError:
+        pass
+    result = _rewrite(node, memo)
+    memo[id(node)] = (node, result)  # Keep the node alive with its id.
+    return result
+
+
+def _rewrite(node, memo):
+    builder = getattr(node, 'builder', None)
+    if builder is None or not node.children:
+        return node
+    # Children that aren't tasks (such as a queue) pass through.
+    children = [_optimize(child, memo) for child in node.children]
+
+    if not node.initkwargs:
+        if builder is decorators.identity:
+            return children[0]
+        if builder is decorators.flip and _isPlain(children[0],
+                                                   decorators.flip):
+            return children[0].children[0]
+        if builder is core.sequence or builder is core.selector:
+            if builder is core.sequence:
+                noop = core.succeed
+            else:
+                noop = core.fail
+            flat = []
+            for child in children:
+                if _isPlain(child, builder):
+                    flat.extend(child.children)
+                elif getattr(child, 'builder', None) is not noop:
+                    flat.append(child)
+            if len(flat) == 1:
+                return flat[0]
+            children = flat
+
+    if (len(children) == len(node.children)
+        and all(a is b for a, b in zip(children, node.children))):
+        return node
+    return builder(*children, **node.initkwargs)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""pool -- recycle running tree instances for Owyl.
+
+Agents that spawn and despawn often shouldn't rebuild their tree and
+allocate a fresh visitor each time. A L{TreePool} holds a tree that is
+built once, and recycles the running instances of it:
+
+    >>> pool = TreePool(buildTree())
+    >>> visitor = pool.acquire(blackboard=bb)  # On spawn
+    >>> pool.release(visitor)                  # On despawn
+
+For core trees, an instance is a L{Visitor<owyl.core.Visitor>}, which
+is restarted from the root on reuse. For L{owyl.nodes} trees, an
+instance is the root L{Node<owyl.nodes.Node>}, and the whole node
+tree is reset and re-bound in place, so a spawn allocates no nodes at
+all.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import core
+import nodes
+
+__all__ = ['TreePool']
+
+
+class TreePool(object):
+    """A pool of running instances of a tree.
+
+    @ivar created: The number of instances allocated.
+    @ivar reused: The number of instances recycled.
+    """
+    def __init__(self, tree, maxsize=None):
+        """
+        @param tree: The tree to instantiate.
+
+        @keyword maxsize: The most free instances to keep. Instances
+                          released beyond this are discarded.
+        @type maxsize: int
+        """
+        self.tree = tree
+        self.maxsize = maxsize
+        self.free = []
+        self.created = 0
+        self.reused = 0
+        self._nodes = isinstance(tree, nodes.NodeFactory)
+
+    def __len__(self):
+        return len(self.free)
+
+    def acquire(self, **kwargs):
+        """Return an instance of the tree in its initial state, run with
+        the given keyword arguments.
+        """
+        if self.free:
+            instance = self.free.pop()
+            if self._nodes:
+                instance.bind(kwargs)
+            else:
+                instance.reset(**kwargs)
+            self.reused += 1
+            return instance
+        self.created += 1
+        if self._nodes:
+            return self.tree(**kwargs)
+        return core.visit(self.tree, **kwargs)
+
+    def release(self, instance):
+        """Return an instance to the pool.
+
+        The instance is reset at once, so that its running state no
+        longer refers to the agent, and the tasks it was running are
+        closed.
+        """
+        if self.maxsize is not None and len(self.free) >= self.maxsize:
+            instance.close()
+            return
+        instance.reset()
+        self.free.append(instance)
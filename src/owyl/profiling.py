@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""profiling -- per-node profiling for Owyl behavior trees.
+
+A L{Profiler} records, for every node of every tree visited while it
+is running, how often the node was started, how long it took (with
+and without its children), and what it yielded:
+
+    >>> profiler = Profiler()
+    >>> profiler.start()
+    >>> # ... build visitors and run them ...
+    >>> profiler.stop()
+    >>> profiler.dump()
+
+Nodes are identified by name (see L{nodeName<owyl.core.nodeName>}),
+so results are aggregated across all agents. Profiling is opt-in:
+only visitors created while the profiler is running are instrumented.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import sys
+
+import core
+
+__all__ = ['Profiler']
+
+CALLS, TOTAL, OWN, SUCCEEDED, FAILED, STALLED = range(6)
+
+
+class Profiler(object):
+    """Aggregate per-node statistics across all visitors.
+
+    @ivar stats: C{[calls, total, own, succeeded, failed, stalled]}
+                 by node name. Times are in seconds; the last three
+                 count the True, False and None values the node
+                 yielded.
+    """
+    columns = ('calls', 'total', 'own', 'succeeded', 'failed', 'stalled')
+
+    def __init__(self):
+        self.stats = {}
+
+    def start(self):
+        """Profile all visitors created from now on.
+        """
+        core.setMonitor(self)
+
+    def stop(self):
+        """Stop profiling new visitors.
+        """
+        core.setMonitor(None)
+
+    def clear(self):
+        """Discard the statistics collected so far.
+        """
+        self.stats.clear()
+
+    def attach(self, visitor):
+        return self
+
+    def _get(self, node):
+        name = core.nodeName(node)
+        try:
+            return self.stats[name]
+        except KeyError:
+            stats = self.stats[name] = [0, 0.0, 0.0, 0, 0, 0]
+            return stats
+
+    def enter(self, node):
+        self._get(node)[CALLS] += 1
+
+    def status(self, node, value):
+        stats = self._get(node)
+        if value is None:
+            stats[STALLED] += 1
+        elif value:
+            stats[SUCCEEDED] += 1
+        else:
+            stats[FAILED] += 1
+
+    def exit(self, node, result, total, own):
+        stats = self._get(node)
+        stats[TOTAL] += total
+        stats[OWN] += own
+
+    def table(self, sort='own'):
+        """Return the statistics as a table, one node per row.
+
+        @keyword sort: The column to sort by, descending.
+        @type sort: One of L{columns}
+        """
+        index = list(self.columns).index(sort)
+        rows = sorted(self.stats.iteritems(),
+                      key=lambda item: item[1][index], reverse=True)
+        width = max([len('node')] + [len(name) for name, s in rows])
+        lines = ['%-*s %9s %12s %12s %9s %9s %9s'
+                 % ((width, 'node') + self.columns)]
+        for name, (calls, total, own, succeeded, failed, stalled) in rows:
+            lines.append('%-*s %9d %12.6f %12.6f %9d %9d %9d'
+                         % (width, name, calls, total, own,
+                            succeeded, failed, stalled))
+        return '\n'.join(lines)
+
+    def dump(self, stream=None, sort='own'):
+        """Write the statistics table to a stream (default stdout).
+        """
+        if stream is None:
+            stream = sys.stdout
+        stream.write(self.table(sort) + '\n')
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""registry -- name the tasks that trees are built from.
+
+Trees that are stored as data (see L{owyl.serialize} and L{owyl.dsl})
+refer to their tasks by name. A L{Registry} maps those names to task
+builders, and to any other callables a tree needs as a keyword
+argument (such as a C{check} function for
+L{checkBB<owyl.blackboard.checkBB>}).
+
+The L{default} registry knows the tasks in L{owyl.core},
+L{owyl.decorators} and L{owyl.blackboard}. Custom tasks are added
+with L{register}:
+
+    >>> @register
+    ... @owyl.task
+    ... def eat(**kwargs):
+    ...     yield True
+
+A registry may extend another, falling back to it for names it
+doesn't know.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import core
+import decorators
+import blackboard
+
+__all__ = ['Registry', 'default', 'register']
+
+
+class Registry(object):
+    """A mapping of names to task builders and other callables.
+    """
+    def __init__(self, parent=None):
+        """
+        @keyword parent: A registry to fall back to.
+        @type parent: L{Registry}
+        """
+        self.parent = parent
+        self.objects = {}  # name -> object
+        self.names = {}  # id(object) -> name
+
+    def register(self, obj, name=None):
+        """Register an object, by default under its C{__name__}.
+
+        Returns the object, so this can be used as a decorator.
+        """
+        if name is None:
+            name = obj.__name__
+        old = self.objects.get(name)
+        if old is not None:
+            del self.names[id(old)]
+        self.objects[name] = obj
+        self.names[id(obj)] = name
+        return obj
+
+    def __getitem__(self, name):
+        try:
+            return self.objects[name]
+        except KeyError:
+            if self.parent is None:
+                raise
+            return self.parent[name]
+
+    def __contains__(self, name):
+        return (name in self.objects
+                or (self.parent is not None and name in self.parent))
+
+    def nameOf(self, obj):
+        """Return the name an object is registered under, or None.
+        """
+        try:
+            return self.names[id(obj)]
+        except KeyError:
+            if self.parent is None:
+                return None
+            return self.parent.nameOf(obj)
+
+
+default = Registry()
+register = default.register
+
+for task in (core.succeed, core.fail, core.stall,
+             core.succeedAfter, core.failAfter,
+             core.sequence, core.selector, core.parallel,
+             core.utilitySelector, core.reactiveSelector,
+             core.weightedSelector, core.weightedSequence,
+             core.queue, core.parallel_queue, core.priority_queue,
+             core.throw, core.catch, core.log,
+             decorators.identity, decorators.flip, decorators.repeatAlways,
+             decorators.repeatUntilFail, decorators.repeatUntilSucceed,
+             decorators.limit,
+             blackboard.checkBB, blackboard.setBB, blackboard.waitBB):
+    register(task)
+del task
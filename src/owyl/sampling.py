@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""sampling -- a sampling profiler for Owyl behavior trees.
+
+A L{Sampler} periodically looks at where every running visitor is in
+its tree, and counts the tree paths it finds. The counts are written
+as folded stacks, one path per line, which flame graph tools (such as
+C{flamegraph.pl}) render in terms of the tree rather than the Python
+frames that run it::
+
+    parallel;repeatAlways;sequence;hasCloseNeighbors 120
+
+    >>> sampler = Sampler()
+    >>> sampler.start(interval=0.01)
+    >>> # ... run the agents ...
+    >>> sampler.stop()
+    >>> sampler.dump(open('owyl.folded', 'w'))
+
+Visitors are only registered, not instrumented, so they run at full
+speed; the cost is in the sampling itself. Only visitors created while
+the sampler is installed are seen. Nested visitors (such as those run
+by L{parallel<owyl.core.parallel>}) are sampled under their parent's
+path; each visitor passes a reference to itself to its tree's tasks,
+and so to the visitors they nest, as the C{owyl.sample} keyword.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import sys
+import threading
+import time
+import weakref
+
+import core
+
+__all__ = ['Sampler']
+
+_KEY = 'owyl.sample'  # Run-time keyword holding the parent visitor
+
+
+def _frames(stack):
+    """Return the iterators on a visitor's stack, outermost first.
+    """
+    try:
+        return stack.as_list()
+    except AttributeError:
+        return list(stack)
+
+
+class Sampler(object):
+    """Count the tree paths of running visitors.
+
+    @ivar counts: Samples by path, a tuple of node names from the root.
+    @ivar samples: The number of times L{sample} has been called.
+    """
+    def __init__(self):
+        self.counts = {}
+        self.samples = 0
+        # weakref to visitor -> weakref to its parent visitor, or None.
+        # It is only ever updated or copied in a single step, so the
+        # sampling thread needs no lock to read it.
+        self._visitors = {}
+        self._thread = None
+        self._running = False
+
+    def install(self):
+        """Register the visitors created from now on.
+        """
+        core.setMonitor(self)
+
+    def uninstall(self):
+        """Stop registering new visitors.
+        """
+        core.setMonitor(None)
+
+    def attach(self, visitor):
+        # Every visitor passes a reference to itself down to the visitors
+        # nested in its tree, which run with its keyword arguments.
+        ref = weakref.ref(visitor, self._forget)
+        self._visitors[ref] = visitor.kwargs.get(_KEY)
+        visitor.context = {_KEY: ref}
+        return None  # No hooks: the visitor runs uninstrumented.
+
+    def _forget(self, ref):
+        self._visitors.pop(ref, None)
+
+    def _path(self, visitor, parents):
+        """Return a visitor's path, including its parents' paths.
+        """
+        current = visitor.current
+        if current is None:
+            return ()
+        names = tuple(core.nodeName(node) for node in _frames(visitor.stack))
+        names += (core.nodeName(current),)
+        parent = parents.get(visitor)
+        if parent is not None:
+            parent = parent()
+            if parent is not None:
+                return self._path(parent, parents) + names
+        return names
+
+    def sample(self):
+        """Count the current path of every running visitor.
+
+        Visitors that are running nested visitors aren't counted
+        themselves; their path is part of their children's.
+        """
+        parents = {}
+        for ref, parent in dict(self._visitors).iteritems():
+            visitor = ref()
+            if visitor is not None:
+                parents[visitor] = parent
+        self.samples += 1
+        running = [v for v in parents
+                   if not v.finished and v.current is not None]
+        busy = set()
+        for visitor in running:
+            parent = parents.get(visitor)
+            if parent is not None:
+                busy.add(parent())
+        counts = self.counts
+        for visitor in running:
+            if visitor in busy:
+                continue
+            try:
+                path = self._path(visitor, parents)
+            except Exception:
+                continue  # The visitor moved while we looked at it.
+            if path:
+                counts[path] = counts.get(path, 0) + 1
+
+    def start(self, interval=0.01):
+        """Install the sampler, and sample every C{interval} seconds in
+        a background thread.
+        """
+        self.install()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, args=(interval,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and registering new visitors.
+        """
+        self.uninstall()
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self, interval):
+        while self._running:
+            self.sample()
+            time.sleep(interval)
+
+    def clear(self):
+        """Discard the samples collected so far.
+        """
+        self.counts.clear()
+        self.samples = 0
+
+    def folded(self):
+        """Return the samples as folded stacks, one C{path count} line
+        per path.
+        """
+        lines = ['%s %d' % (';'.join(path), count)
+                 for path, count in sorted(self.counts.iteritems())]
+        return '\n'.join(lines)
+
+    def dump(self, stream=None):
+        """Write the folded stacks to a stream (default stdout).
+        """
+        if stream is None:
+            stream = sys.stdout
+        stream.write(self.folded() + '\n')
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""scheduler -- batch scheduling of many behavior trees for Owyl.
+
+A L{TreeScheduler} owns the visitors for a whole population of agents
+and ticks them all in a single call, rather than having the host
+schedule and step each agent's visitor individually.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+from collections import namedtuple, deque
+from functools import partial
+
+import core
+import nodes
+
+__all__ = ['TreeScheduler', 'Agent', 'TickStats']
+
+
+TickStats = namedtuple('TickStats',
+                       'ticked succeeded failed running finished')
+
+
+class Agent(object):
+    """A single scheduled tree and its visitor.
+
+    Agents are created by L{TreeScheduler.add}, and serve as the handle
+    for parking, waking, and removing the tree.
+
+    @ivar result: The termination status (True or False) of the tree,
+                  or None until it has terminated.
+    @ivar last: The last status (True or False) passed up the tree.
+    @ivar finished: True once the tree has run to completion, or the
+                    agent has been removed.
+    @ivar parked: True while the agent is off the run-list.
+    """
+    __slots__ = ('visitor', 'step', 'result', 'finished', 'parked',
+                 'listed', 'data', 'last', 'index', '__weakref__')
+
+    def __init__(self, visitor, data=None):
+        self.visitor = visitor
+        self.step = visitor.next
+        self.result = None
+        self.finished = False
+        self.parked = False
+        self.listed = True  # On the run-list (possibly awaiting removal)
+        self.data = data
+        self.last = None
+        self.index = None  # Position in the scheduler's agents
+
+
+class TreeScheduler(object):
+    """Tick many behavior trees at once.
+
+    Each tree added to the scheduler gets its own visitor (see
+    L{visit<owyl.core.visit>}). A call to L{tick} advances every
+    runnable visitor by one step. Agents that have been parked, or
+    whose trees have finished, are dropped from the run-list so that
+    they cost nothing per tick.
+
+    If C{until_stall} is true, each agent's tree is driven until it
+    stalls or terminates on every tick (see
+    L{Visitor.run_until_stall<owyl.core.Visitor.run_until_stall>}), and
+    agents yielding a termination status are finished at once.
+
+    Agents whose visitor parks on a L{Wait<owyl.core.Wait>} are parked
+    automatically, and woken at the start of the first tick after the
+    wait is over. If set, C{onwake} is then called with no arguments
+    (possibly from another thread).
+
+    >>> scheduler = TreeScheduler()
+    >>> agent = scheduler.add(tree, blackboard=bb)
+    >>> stats = scheduler.tick()
+    """
+    def __init__(self, until_stall=False):
+        self.until_stall = until_stall
+        self.agents = []  # Canonical list of live agents, unordered
+        self._running = []  # The run-list
+        self._dirty = False  # Rebuild the run-list before the next tick?
+        self._woken = deque()  # Agents woken by their visitors
+        self.ticks = 0
+        self.finished = []  # Agents finished on the last tick
+        self.onwake = None
+
+    def __len__(self):
+        return len(self.agents)
+
+    def __iter__(self):
+        return iter(self.agents)
+
+    def add(self, tree, data=None, **kwargs):
+        """Add a tree to the scheduler, returning its L{Agent}.
+
+        @param tree: The tree to visit.
+
+        @param data: Arbitrary host data to attach to the agent.
+
+        Other keyword arguments are passed on to L{visit<owyl.core.visit>}.
+
+        Trees built with L{owyl.nodes} are ticked directly, without a
+        visitor.
+        """
+        if isinstance(tree, nodes.NodeFactory):
+            visitor = tree(**kwargs)
+        else:
+            visitor = core.visit(tree, **kwargs)
+        agent = Agent(visitor, data)
+        agent.index = len(self.agents)
+        if self.until_stall:
+            agent.step = getattr(visitor, 'run_until_stall', visitor.next)
+        if isinstance(visitor, core.Visitor):
+            visitor.onwait = partial(self.park, agent)
+            visitor.onwake = partial(self._visitorWoken, agent)
+        self.agents.append(agent)
+        self._running.append(agent)
+        return agent
+
+    def remove(self, agent):
+        """Remove the agent from the scheduler, halting its tree.
+
+        Removing an agent that has already finished does nothing.
+        """
+        if agent.finished:
+            return
+        self._discard(agent)
+        agent.visitor.close()
+        agent.parked = agent.finished = True
+        self._dirty = True
+
+    def park(self, agent):
+        """Take the agent off the run-list until it is woken.
+        """
+        if not agent.parked:
+            agent.parked = True
+            self._dirty = True
+
+    def wake(self, agent):
+        """Return a parked agent to the run-list.
+        """
+        if agent.parked and not agent.finished:
+            agent.parked = False
+            if not agent.listed:
+                agent.listed = True
+                self._running.append(agent)
+
+    @property
+    def pending(self):
+        """The number of agents that will run on the next tick.
+        """
+        if self._dirty:
+            self._compact()
+        return len(self._running) + len(self._woken)
+
+    def _visitorWoken(self, agent):
+        # May be called from another thread; the wake is deferred to
+        # the next tick.
+        self._woken.append(agent)
+        if self.onwake is not None:
+            self.onwake()
+
+    def _discard(self, agent):
+        """Drop the agent from the live agents, moving the last agent
+        into its place.
+        """
+        agents = self.agents
+        last = agents.pop()
+        if last is not agent:
+            agents[agent.index] = last
+            last.index = agent.index
+        agent.index = None
+
+    def _compact(self):
+        """Drop parked and finished agents from the run-list.
+        """
+        keep = []
+        for agent in self._running:
+            if agent.parked:
+                agent.listed = False
+            else:
+                keep.append(agent)
+        self._running[:] = keep
+        self._dirty = False
+
+    def tick(self):
+        """Run one step on each runnable agent.
+
+        @return: totals for this tick.
+        @rtype: L{TickStats}
+        """
+        woken = self._woken
+        while woken:
+            self.wake(woken.popleft())
+        if self._dirty:
+            self._compact()
+        until_stall = self.until_stall
+        ticked = len(self._running)
+        running = succeeded = failed = 0
+        done = []
+        for agent in self._running:
+            try:
+                result = agent.step()
+                if agent.finished:
+                    # Removed during its own step: finish the halt.
+                    agent.visitor.close()
+                    continue
+            except StopIteration:
+                if agent.finished:
+                    continue  # Removed during its own last step.
+                # The last status passed up was the tree's own.
+                result = agent.result = agent.last
+                agent.finished = agent.parked = True
+                done.append(agent)
+                if result:
+                    succeeded += 1
+                elif result is not None:
+                    failed += 1
+                continue
+            if result is None:
+                running += 1
+                continue
+            if until_stall:
+                agent.result = result
+                agent.finished = agent.parked = True
+                done.append(agent)
+                if result:
+                    succeeded += 1
+                else:
+                    failed += 1
+            else:
+                # A status from somewhere in the tree; it's the tree's
+                # own only if the tree stops next.
+                agent.last = result
+        if done:
+            for agent in done:
+                self._discard(agent)
+            self._dirty = True
+        self.finished = done
+        self.ticks += 1
+        return TickStats(ticked, succeeded, failed, running, len(done))
+
+    def run(self, ticks=None):
+        """Tick until every agent is finished or parked.
+
+        @keyword ticks: Stop after this many ticks, if given.
+
+        @return: The number of ticks run.
+        """
+        count = 0
+        while self.pending and (ticks is None or count < ticks):
+            self.tick()
+            count += 1
+        return count
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""serialize -- a compact binary format for tree definitions.
+
+L{dumps} writes a tree definition (the tasks, their children and
+their initialization keyword arguments) to a compact binary string,
+and L{loads} builds the tree again from it, in another process or on
+another machine, without the code that built it:
+
+    >>> data = dumps(buildTree())
+    >>> tree = loads(data)
+
+Tasks are written by name, so every task in the tree must be in the
+L{registry<owyl.registry>}, and must have been built by the
+L{task<owyl.core.task>} family of decorators (which record how a
+task was built). Keyword arguments may be None, booleans, numbers,
+strings, lists, tuples, dicts, trees, or registered objects.
+Subtrees that are shared in the original tree are written once, and
+are shared again when loaded.
+
+Loading the data for the first time calls the same task builders as
+building the tree in code, and parses the data besides, so it is no
+faster. L{loads} caches the tree it builds by the hash of the data,
+though, so loading the same data again (for every agent spawned, say)
+is only a lookup. The cache keeps the L{CACHE_SIZE} trees used most
+recently. (To share one built tree between agents without the data,
+see L{owyl.flyweight}.)
+
+Format
+======
+
+  A 5-byte header (C{OWYL} and a version byte), a table of the strings
+  used, then the root node. A node is the string index of its task's
+  name, its children and its keyword arguments; children and values
+  are written as a tag byte followed by the value. Integers are
+  little-endian. A node seen again is written as a reference to its
+  number; nodes are numbered in postorder, as they finish.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+from collections import OrderedDict
+from hashlib import sha1
+from struct import Struct, error as StructError
+
+import registry as _registry
+
+__all__ = ['dumps', 'loads', 'dump', 'load', 'clearCache',
+           'SerializeError', 'CACHE_SIZE']
+
+CACHE_SIZE = 256
+
+_cache = OrderedDict()  # (sha1 of the data, registry) -> tree, oldest first
+
+MAGIC = 'OWYL'
+VERSION = 1
+
+_U16 = Struct('<H')
+_U32 = Struct('<I')
+_I64 = Struct('<q')
+_F64 = Struct('<d')
+_NODE = Struct('<HHH')  # name, number of children, number of kwargs
+
+# Value tags
+NONE, TRUE, FALSE = 'N', 'T', 'F'
+INT, FLOAT, LONG = 'i', 'd', 'L'
+STR, UNICODE = 's', 'u'
+LIST, TUPLE, DICT = 'l', 't', 'm'
+NODE, SHARED, REF = 'n', 'p', 'r'
+
+
+class SerializeError(ValueError):
+    """A tree can't be written or read.
+    """
+    pass
+
+
+class _Writer(object):
+    def __init__(self, registry):
+        self.registry = registry
+        self.strings = {}  # str -> index
+        self.nodes = {}  # id(node) -> index, in the order they're read
+        self.keep = []  # Keep written nodes alive, so ids stay unique.
+        self.out = []
+
+    def string(self, s):
+        try:
+            return self.strings[s]
+        except KeyError:
+            index = self.strings[s] = len(self.strings)
+            if index > 0xffff:
+                raise SerializeError("too many strings")
+            return index
+
+    def node(self, node):
+        name = self.registry.nameOf(node.builder)
+        if name is None:
+            raise SerializeError("task not registered: %s" % node.builder)
+        kwargs = node.initkwargs
+        self.out.append(_NODE.pack(self.string(name), len(node.children),
+                                   len(kwargs)))
+        for child in node.children:
+            self.value(child)
+        for key in sorted(kwargs):
+            if not isinstance(key, str):
+                raise SerializeError("keyword must be a str: %r" % (key,))
+            self.out.append(_U16.pack(self.string(key)))
+            self.value(kwargs[key])
+        self.nodes[id(node)] = len(self.nodes)
+        self.keep.append(node)
+
+    def value(self, value):
+        out = self.out
+        if value is None:
+            out.append(NONE)
+        elif value is True:
+            out.append(TRUE)
+        elif value is False:
+            out.append(FALSE)
+        elif isinstance(value, (int, long)):
+            if -2**63 <= value < 2**63:
+                out.append(INT + _I64.pack(value))
+            else:
+                data = str(value)
+                out.append(LONG + _U32.pack(len(data)) + data)
+        elif isinstance(value, float):
+            out.append(FLOAT + _F64.pack(value))
+        elif isinstance(value, str):
+            out.append(STR + _U16.pack(self.string(value)))
+        elif isinstance(value, unicode):
+            data = value.encode('utf-8')
+            out.append(UNICODE + _U32.pack(len(data)) + data)
+        elif isinstance(value, (list, tuple)):
+            out.append((LIST if isinstance(value, list) else TUPLE)
+                       + _U32.pack(len(value)))
+            for item in value:
+                self.value(item)
+        elif isinstance(value, dict):
+            out.append(DICT + _U32.pack(len(value)))
+            for key, item in value.iteritems():
+                self.value(key)
+                self.value(item)
+        else:
+            name = self.registry.nameOf(value)
+            if name is not None:
+                out.append(REF + _U16.pack(self.string(name)))
+            elif id(value) in self.nodes:
+                out.append(SHARED + _U32.pack(self.nodes[id(value)]))
+            elif getattr(value, 'builder', None) is not None:
+                out.append(NODE)
+                self.node(value)
+            else:
+                raise SerializeError("can't serialize %r" % (value,))
+
+    def finish(self, tree):
+        self.value(tree)
+        strings = sorted(self.strings, key=self.strings.get)
+        header = [MAGIC, chr(VERSION), _U16.pack(len(strings))]
+        for s in strings:
+            header.append(_U16.pack(len(s)))
+            header.append(s)
+        return ''.join(header + self.out)
+
+
+def dumps(tree, registry=None):
+    """Return a tree definition as a binary string.
+
+    @keyword registry: The registry to name tasks from. (Default: the
+                       L{default<owyl.registry.default>} registry.)
+    @type registry: L{Registry<owyl.registry.Registry>}
+    """
+    if registry is None:
+        registry = _registry.default
+    return _Writer(registry).finish(tree)
+
+
+def dump(tree, stream, registry=None):
+    """Write a tree definition to a stream.
+    """
+    stream.write(dumps(tree, registry))
+
+
+class _Reader(object):
+    def __init__(self, data, registry):
+        self.data = data
+        self.registry = registry
+        self.nodes = []
+        self.builders = {}  # string index -> builder
+        if data[:4] != MAGIC:
+            raise SerializeError("not a serialized tree")
+        if ord(data[4]) != VERSION:
+            raise SerializeError("unknown version: %d" % ord(data[4]))
+        unpack = _U16.unpack_from
+        count, = unpack(data, 5)
+        offset = 7
+        strings = self.strings = []
+        for x in xrange(count):
+            length, = unpack(data, offset)
+            offset += 2
+            strings.append(data[offset:offset + length])
+            offset += length
+        self.offset = offset
+        self.readers = {
+            NONE: lambda: None, TRUE: lambda: True, FALSE: lambda: False,
+            INT: self.int, FLOAT: self.float, LONG: self.long,
+            STR: self.str, UNICODE: self.unicode,
+            LIST: self.list, TUPLE: self.tuple, DICT: self.dict,
+            NODE: self.node, SHARED: self.shared, REF: self.ref,
+        }
+
+    def value(self):
+        tag = self.data[self.offset]
+        self.offset += 1
+        try:
+            reader = self.readers[tag]
+        except KeyError:
+            raise SerializeError("bad tag %r at %d" % (tag, self.offset - 1))
+        return reader()
+
+    def _unpack(self, struct):
+        value, = struct.unpack_from(self.data, self.offset)
+        self.offset += struct.size
+        return value
+
+    def int(self):
+        return self._unpack(_I64)
+
+    def float(self):
+        return self._unpack(_F64)
+
+    def long(self):
+        length = self._unpack(_U32)
+        start = self.offset
+        self.offset += length
+        return long(self.data[start:self.offset])
+
+    def str(self):
+        return self.strings[self._unpack(_U16)]
+
+    def unicode(self):
+        length = self._unpack(_U32)
+        start = self.offset
+        self.offset += length
+        return self.data[start:self.offset].decode('utf-8')
+
+    def list(self):
+        value = self.value
+        return [value() for x in xrange(self._unpack(_U32))]
+
+    def tuple(self):
+        return tuple(self.list())
+
+    def dict(self):
+        value = self.value
+        result = {}
+        for x in xrange(self._unpack(_U32)):
+            key = value()
+            result[key] = value()
+        return result
+
+    def ref(self):
+        name = self.strings[self._unpack(_U16)]
+        try:
+            return self.registry[name]
+        except KeyError:
+            raise SerializeError("not registered: %s" % name)
+
+    def shared(self):
+        return self.nodes[self._unpack(_U32)]
+
+    def node(self):
+        name, nchildren, nkwargs = _NODE.unpack_from(self.data, self.offset)
+        self.offset += _NODE.size
+        try:
+            builder = self.builders[name]
+        except KeyError:
+            try:
+                builder = self.registry[self.strings[name]]
+            except KeyError:
+                raise SerializeError("task not registered: %s"
+                                     % self.strings[name])
+            self.builders[name] = builder
+        value = self.value
+        children = [value() for x in xrange(nchildren)]
+        kwargs = {}
+        strings = self.strings
+        for x in xrange(nkwargs):
+            key = strings[self._unpack(_U16)]
+            kwargs[key] = value()
+        node = builder(*children, **kwargs)
+        self.nodes.append(node)
+        return node
+
+
+def loads(data, registry=None):
+    """Build a tree definition from a binary string.
+
+    The tree is cached, so loading the same data again with the same
+    registry returns the same tree.
+
+    @keyword registry: The registry to look tasks up in. (Default: the
+                       L{default<owyl.registry.default>} registry.)
+    @type registry: L{Registry<owyl.registry.Registry>}
+    """
+    if registry is None:
+        registry = _registry.default
+    key = (sha1(data).hexdigest(), registry)
+    try:
+        tree = _cache.pop(key)
+    except KeyError:
+        try:
+            tree = _Reader(data, registry).value()
+        except (IndexError, TypeError, StructError), e:
+            raise SerializeError("truncated or corrupt data: %s" % e)
+        while len(_cache) >= CACHE_SIZE:
+            _cache.popitem(last=False)
+    _cache[key] = tree  # Now the most recently used.
+    return tree
+
+
+def load(stream, registry=None):
+    """Build a tree definition read from a stream.
+    """
+    return loads(stream.read(), registry)
+
+
+def clearCache():
+    """Forget all loaded trees.
+    """
+    _cache.clear()
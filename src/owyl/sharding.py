@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""sharding -- tick agent populations across worker processes.
+
+A L{ShardedRunner} partitions agents across worker processes, each
+running its own L{TreeScheduler<owyl.scheduler.TreeScheduler>}, and
+ticks every shard in parallel.
+
+Trees can't be sent between processes, so agents are added as a
+I{builder}: a picklable callable (such as a module-level function)
+that returns the agent's tree. Each agent has its own blackboard in
+its worker. Blackboard updates are exchanged at tick boundaries:
+values posted by the host are written before the tick, and values
+written by the trees are sent back after it, as compact lists of
+C{(agent, key, value)} records.
+
+    >>> runner = ShardedRunner(processes=4)
+    >>> aid = runner.add(buildTree, {'hunger': 0})
+    >>> runner.post(aid, 'hunger', 10)
+    >>> stats = runner.tick()
+    >>> runner.blackboard(aid)['state']
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import cPickle as pickle
+import multiprocessing
+import traceback
+
+from blackboard import Blackboard
+from scheduler import TreeScheduler, TickStats
+
+__all__ = ['ShardedRunner', 'ShardError']
+
+PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+
+class ShardError(RuntimeError):
+    """An agent's tree raised an exception in a worker process.
+    """
+    pass
+
+
+class _ShardBlackboard(Blackboard):
+    """A blackboard that records which keys the tree writes.
+    """
+    def __init__(self, name, written, **kwargs):
+        super(_ShardBlackboard, self).__init__(name, **kwargs)
+        self.aid = name[1]
+        self.written = written  # Shard-wide list of (aid, key) writes
+
+    def __setitem__(self, key, value):
+        super(_ShardBlackboard, self).__setitem__(key, value)
+        self.written.append((self.aid, key))
+
+
+def _work(conn, until_stall):
+    """Run a shard: receive tick messages, and reply with the results.
+    """
+    scheduler = TreeScheduler(until_stall=until_stall)
+    agents = {}  # aid -> Agent
+    boards = {}  # aid -> _ShardBlackboard
+    written = []
+    while True:
+        message = pickle.loads(conn.recv_bytes())
+        if message is None:
+            break
+        adds, removes, updates, broadcasts = message
+        try:
+            for aid, builder, args, kwargs, values in adds:
+                bb = _ShardBlackboard(('owyl.sharding', aid), written,
+                                      **values)
+                boards[aid] = bb
+                agents[aid] = scheduler.add(builder(*args), data=aid,
+                                            blackboard=bb, **kwargs)
+            for aid in removes:
+                # The agent may have finished since the host removed it.
+                if aid in agents:
+                    scheduler.remove(agents.pop(aid))
+                    Blackboard._name_dict.pop(('owyl.sharding', aid), None)
+                    del boards[aid]
+            for aid, key, value in updates:
+                if aid in boards:
+                    boards[aid][key] = value
+            for key, value in broadcasts:
+                for bb in boards.itervalues():
+                    bb[key] = value
+            del written[:]  # The host already knows its own updates.
+
+            stats = scheduler.tick()
+
+            finished = []
+            for agent in scheduler.finished:
+                aid = agent.data
+                finished.append((aid, agent.result))
+                del agents[aid]
+            deltas = []
+            seen = set()
+            for aid, key in written:
+                if (aid, key) not in seen and aid in boards:
+                    seen.add((aid, key))
+                    deltas.append((aid, key, boards[aid][key]))
+            del written[:]
+            for aid, result in finished:
+                Blackboard._name_dict.pop(('owyl.sharding', aid), None)
+                del boards[aid]
+            reply = (tuple(stats), finished, deltas)
+        except Exception:
+            reply = traceback.format_exc()
+        conn.send_bytes(pickle.dumps(reply, PROTOCOL))
+    conn.close()
+
+
+class _Shard(object):
+    """The host side of a worker process.
+    """
+    def __init__(self, until_stall):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_work,
+                                               args=(child, until_stall))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.size = 0
+        self.adds = []
+        self.removes = []
+        self.updates = []
+
+    def send(self, broadcasts):
+        message = (self.adds, self.removes, self.updates, broadcasts)
+        self.conn.send_bytes(pickle.dumps(message, PROTOCOL))
+        self.adds = []
+        self.removes = []
+        self.updates = []
+
+    def receive(self):
+        return pickle.loads(self.conn.recv_bytes())
+
+    def close(self):
+        self.conn.send_bytes(pickle.dumps(None, PROTOCOL))
+        self.process.join()
+        self.conn.close()
+
+
+class ShardedRunner(object):
+    """Tick a population of agents across worker processes.
+
+    @ivar results: The final status of each finished agent, by id.
+    """
+    def __init__(self, processes=None, until_stall=False):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.shards = [_Shard(until_stall) for x in xrange(processes)]
+        self.boards = {}  # aid -> host copy of the agent's blackboard
+        self.owners = {}  # aid -> _Shard
+        self.results = {}
+        self.broadcasts = []
+        self.ticks = 0
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self.owners)
+
+    def add(self, builder, values=None, *args, **kwargs):
+        """Add an agent to the least loaded shard, returning its id.
+
+        @param builder: A picklable callable returning the agent's tree.
+
+        @param values: Initial values for the agent's blackboard.
+        @type values: C{dict}
+
+        Other positional arguments are passed to the builder, and
+        keyword arguments to L{visit<owyl.core.visit>}. All must be
+        picklable.
+        """
+        values = dict(values or {})
+        aid = self._next_id
+        self._next_id += 1
+        shard = min(self.shards, key=lambda s: s.size)
+        shard.adds.append((aid, builder, args, kwargs, values))
+        shard.size += 1
+        self.owners[aid] = shard
+        self.boards[aid] = values
+        return aid
+
+    def remove(self, aid):
+        """Remove the agent at the next tick.
+
+        Finished agents' blackboards and results are kept until they
+        are removed.
+        """
+        shard = self.owners.pop(aid, None)
+        if shard is not None:
+            shard.removes.append(aid)
+            shard.size -= 1
+        del self.boards[aid]
+        self.results.pop(aid, None)
+
+    def blackboard(self, aid):
+        """Return the host's copy of the agent's blackboard.
+
+        The copy is brought up to date at every tick. Don't write to it
+        directly; use L{post}.
+        """
+        return self.boards[aid]
+
+    def post(self, aid, key, value):
+        """Write a value on the agent's blackboard at the next tick.
+        """
+        self.owners[aid].updates.append((aid, key, value))
+        self.boards[aid][key] = value
+
+    def broadcast(self, key, value):
+        """Write a value on every agent's blackboard at the next tick.
+        """
+        self.broadcasts.append((key, value))
+        for values in self.boards.itervalues():
+            values[key] = value
+
+    def tick(self):
+        """Tick every shard in parallel.
+
+        @return: totals for this tick, across all shards.
+        @rtype: L{TickStats<owyl.scheduler.TickStats>}
+        """
+        broadcasts, self.broadcasts = self.broadcasts, []
+        for shard in self.shards:
+            shard.send(broadcasts)
+        totals = [0] * len(TickStats._fields)
+        errors = []
+        for shard in self.shards:
+            reply = shard.receive()
+            if isinstance(reply, basestring):
+                errors.append(reply)
+                continue
+            stats, finished, deltas = reply
+            for i, count in enumerate(stats):
+                totals[i] += count
+            boards = self.boards
+            for aid, key, value in deltas:
+                if aid in boards:
+                    boards[aid][key] = value
+            for aid, result in finished:
+                self.results[aid] = result
+                if self.owners.pop(aid, None) is not None:
+                    shard.size -= 1
+        if errors:
+            raise ShardError('\n'.join(errors))
+        self.ticks += 1
+        return TickStats(*totals)
+
+    def close(self):
+        """Stop the worker processes.
+        """
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
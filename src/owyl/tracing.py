@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""tracing -- low-overhead execution traces for Owyl behavior trees.
+
+A L{Tracer} records which nodes were entered and exited, when, and
+with what result, into a fixed-size ring buffer per agent. Buffers are
+preallocated arrays, so recording an event allocates no record
+objects, and only one in every C{sample} agents is traced at all; the
+rest run the uninstrumented visitor loop. Traces can be exported in
+the Chrome trace-event format, for viewing in C{chrome://tracing}:
+
+    >>> tracer = Tracer(capacity=4096, sample=100)
+    >>> tracer.start()
+    >>> # ... run the agents ...
+    >>> tracer.export(open('trace.json', 'w'))
+
+Each agent is shown as a process of its own. Nested visitors (such as
+those run by L{parallel<owyl.core.parallel>}) are traced into their
+agent's buffer, each under a thread id of its own, since their nodes
+don't nest within the parent's; a thread id is reused once its visitor
+has finished. Whether a nested visitor is traced is decided by its
+agent's sample, which the tracer passes down with the tree's keyword
+arguments.
+
+Copyright 2008 David Eyk. All rights reserved.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__revision__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import json
+import time
+from array import array
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
+
+import core
+
+__all__ = ['Tracer', 'TraceBuffer', 'ENTER', 'EXIT']
+
+ENTER = 0
+EXIT = 1
+
+_RESULT_CODES = {None: -1, False: 0, True: 1}
+_RESULTS = {-1: None, 0: False, 1: True}
+
+_KEY = 'owyl.trace'  # Run-time keyword holding the agent's buffer
+_UNSAMPLED = {_KEY: None}
+
+
+class TraceBuffer(object):
+    """A ring buffer of trace records for one agent.
+
+    Each record is a kind (L{ENTER} or L{EXIT}), a node name id, a
+    result code, a timestamp and a thread id, stored in parallel
+    arrays. The agent's own visitor records under thread id 0; its
+    nested visitors record through L{lane}s, under the lowest thread
+    ids not in use by another running nested visitor.
+
+    @ivar pid: The agent's id, exported as the process id.
+    @ivar count: The total number of records written. Only the last
+                 C{capacity} are kept.
+    """
+    tid = 0
+
+    def __init__(self, pid, capacity, names):
+        self.pid = pid
+        self.capacity = capacity
+        self.names = names  # name -> id, shared by the tracer
+        self.kinds = array('b', [0]) * capacity
+        self.nodes = array('i', [0]) * capacity
+        self.results = array('b', [0]) * capacity
+        self.times = array('d', [0.0]) * capacity
+        self.tids = array('i', [0]) * capacity
+        self.index = 0
+        self.count = 0
+        self._free = []  # Thread ids released by finished lanes
+        self._lanes = 0  # The highest thread id handed out
+
+    def _nameId(self, node):
+        name = core.nodeName(node)
+        try:
+            return self.names[name]
+        except KeyError:
+            nid = self.names[name] = len(self.names)
+            return nid
+
+    def record(self, kind, tid, node, result):
+        i = self.index
+        self.kinds[i] = kind
+        self.nodes[i] = self._nameId(node)
+        self.results[i] = _RESULT_CODES.get(result, -1)
+        self.times[i] = time.time()
+        self.tids[i] = tid
+        i += 1
+        self.index = i if i < self.capacity else 0
+        self.count += 1
+
+    def enter(self, node):
+        self.record(ENTER, self.tid, node, None)
+
+    def status(self, node, value):
+        pass
+
+    def exit(self, node, result, total, own):
+        self.record(EXIT, self.tid, node, result)
+
+    def lane(self):
+        """Return hooks recording into this buffer under another thread
+        id, for a nested visitor.
+        """
+        return _Lane(self)
+
+    def _acquire(self):
+        if self._free:
+            return heappop(self._free)
+        self._lanes += 1
+        return self._lanes
+
+    def _order(self):
+        if self.count < self.capacity:
+            return xrange(self.count)
+        return range(self.index, self.capacity) + range(self.index)
+
+    def records(self):
+        """Return the kept records, oldest first, as tuples of
+        C{(kind, name id, result, timestamp)}.
+        """
+        return [(self.kinds[i], self.nodes[i], _RESULTS[self.results[i]],
+                 self.times[i]) for i in self._order()]
+
+
+class _Lane(object):
+    """Hooks recording a nested visitor into its agent's buffer.
+
+    The lane takes a thread id when its visitor enters the root node,
+    and gives it back when the visitor exits the root node, or is
+    dropped without doing so (as when it is closed).
+    """
+    __slots__ = ('buffer', 'tid', 'depth')
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.tid = None
+        self.depth = 0
+
+    def enter(self, node):
+        if self.tid is None:
+            self.tid = self.buffer._acquire()
+        self.depth += 1
+        self.buffer.record(ENTER, self.tid, node, None)
+
+    def status(self, node, value):
+        pass
+
+    def exit(self, node, result, total, own):
+        self.buffer.record(EXIT, self.tid, node, result)
+        self.depth -= 1
+        if not self.depth:
+            self.release()
+
+    def release(self):
+        if self.tid is not None:
+            heappush(self.buffer._free, self.tid)
+            self.tid = None
+            self.depth = 0
+
+    __del__ = release
+
+
+class Tracer(object):
+    """Trace a sample of agents into per-agent ring buffers.
+
+    @ivar buffers: The L{TraceBuffer}s of the most recently sampled
+                   agents.
+    """
+    def __init__(self, capacity=4096, sample=1, agents=256):
+        """
+        @keyword capacity: The number of records kept per agent.
+
+        @keyword sample: Trace one in every C{sample} agents.
+
+        @keyword agents: The number of agents' buffers to keep.
+        """
+        self.capacity = capacity
+        self.sample = sample
+        self.names = {}
+        self.buffers = deque(maxlen=agents)
+        self._seen = 0
+        self._pids = count(1)
+
+    def start(self):
+        """Trace a sample of the visitors created from now on.
+        """
+        core.setMonitor(self)
+
+    def stop(self):
+        """Stop tracing new visitors.
+        """
+        core.setMonitor(None)
+
+    def attach(self, visitor):
+        kwargs = visitor.kwargs
+        if _KEY in kwargs:
+            # A nested visitor, run with its agent's keyword arguments.
+            buf = kwargs[_KEY]
+            if buf is None:
+                return None
+            return buf.lane()
+        self._seen += 1
+        if (self._seen - 1) % self.sample:
+            visitor.context = _UNSAMPLED
+            return None
+        buf = TraceBuffer(self._pids.next(), self.capacity, self.names)
+        visitor.context = {_KEY: buf}
+        self.buffers.append(buf)
+        return buf
+
+    def chromeTrace(self):
+        """Return the traces as a Chrome trace-event object.
+        """
+        labels = dict((nid, name) for name, nid in self.names.iteritems())
+        events = []
+        for buf in self.buffers:
+            depths = {}  # tid -> open slices
+            kinds, nodes, results = buf.kinds, buf.nodes, buf.results
+            times, tids, pid = buf.times, buf.tids, buf.pid
+            for i in buf._order():
+                tid = tids[i]
+                depth = depths.get(tid, 0)
+                if kinds[i] == ENTER:
+                    depths[tid] = depth + 1
+                    events.append({'name': labels[nodes[i]], 'ph': 'B',
+                                   'ts': times[i] * 1e6,
+                                   'pid': pid, 'tid': tid})
+                elif depth:
+                    # Exits whose entry was overwritten are dropped.
+                    depths[tid] = depth - 1
+                    events.append({'name': labels[nodes[i]], 'ph': 'E',
+                                   'ts': times[i] * 1e6,
+                                   'pid': pid, 'tid': tid,
+                                   'args': {'result':
+                                            _RESULTS[results[i]]}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, stream):
+        """Write the traces to a stream as Chrome trace-event JSON.
+        """
+        json.dump(self.chromeTrace(), stream)
@@ -12,10 +12,26 @@ __author__ = "$Author$"[9:-2]
 __revision__ = "$Rev$"[6:-2]
 __date__ = "$Date$"[7:-2]
 
+import itertools
+import os
+import random
+import tempfile
 import unittest
 
 import owyl
 from owyl import blackboard
+from owyl import nodes
+from owyl.eventloop import LoopRunner
+from owyl.sharding import ShardedRunner, ShardError
+from owyl.pool import TreePool
+from owyl.profiling import Profiler
+from owyl.tracing import Tracer, ENTER, EXIT
+from owyl.sampling import Sampler
+from owyl import bench
+from owyl.optimize import optimize, size
+from owyl.flyweight import shared, Flyweight
+from owyl import registry, serialize
+from owyl import dsl
 
 
 class OwylTests(unittest.TestCase):
@@ -300,6 +316,29 @@ class OwylTests(unittest.TestCase):
         v = owyl.visit(tree, blackboard=bb)
         self.assertEqual(v.next(), False)
 
+    def testWatchBB(self):
+        """Do watchers fire on writes, but not on reads of missing keys?
+        """
+        bb = blackboard.Blackboard('watch')
+        fired = []
+        bb.watch('x', lambda: fired.append(bb['x']))
+        self.assertEqual(bb['x'], None)
+        self.assertEqual(fired, [])
+        bb['x'] = 1
+        self.assertEqual(fired, [1])
+
+        # Every way of changing the dict notifies the watchers.
+        del bb['x']
+        bb.watch('y', lambda: fired.append('y'))
+        self.assertEqual(bb.setdefault('y', 2), 2)
+        self.assertEqual(bb.setdefault('y', 3), 2)
+        for change in (lambda: bb.pop('y'), bb.popitem, bb.clear):
+            bb['y'] = 4
+            bb.watch('y', lambda: fired.append('y'))
+            change()
+        self.assertEqual(fired, [1, 'y', 'y', 'y', 'y'])
+        self.assertEqual(bb.pop('y', 5), 5)
+
     def testSetBB(self):
         """Can we set a value on a blackboard?
         """
@@ -324,6 +363,385 @@ class OwylTests(unittest.TestCase):
         result = [x for x in v][-1]
         self.assertEqual(result, True)
 
+    def testAdvance(self):
+        """Can we advance a visitor within a step budget?
+        """
+        tree = owyl.sequence(owyl.succeed(),
+                             owyl.succeed(),
+                             owyl.succeedAfter(after=1),
+                             owyl.fail())
+        v = owyl.visit(tree)
+        self.assertEqual(v.advance(steps=1), True)
+        self.assertEqual(v.result, True)
+
+        # The budget resumes where it left off, and stops on a stall.
+        self.assertEqual(v.advance(steps=5), False)
+        self.assertEqual(v.exhausted, False)
+
+        self.assertEqual(v.advance(steps=2), True)
+        self.assertEqual(v.result, False)
+        self.assertEqual(v.advance(), False)
+        self.assertEqual(v.finished, True)
+
+        # A time budget always takes at least one step.
+        v = owyl.visit(tree)
+        self.assertEqual(v.advance(seconds=0), True)
+        self.assertEqual(v.advance(seconds=60), False)
+
+    def testRunUntilStall(self):
+        """Does run_until_stall return one status per logical tick?
+        """
+        tree = owyl.sequence(owyl.succeed(),
+                             owyl.succeedAfter(after=2),
+                             owyl.succeed())
+        for x in xrange(2):
+            v = owyl.visit(tree)
+            self.assertEqual(v.run_until_stall(), None)
+            self.assertEqual(v.run_until_stall(), None)
+            self.assertEqual(v.run_until_stall(), True)
+            self.assertRaises(StopIteration, v.run_until_stall)
+
+        v = owyl.visit(owyl.selector(owyl.fail(), owyl.fail()))
+        self.assertEqual(v.run_until_stall(), False)
+
+    def testWait(self):
+        """Is a task parked on a wait resumed with the wait's value?
+        """
+        bb = blackboard.Blackboard('test', )
+        received = []
+
+        @owyl.task
+        def waiter(**kwargs):
+            value = yield blackboard.WaitForKey(kwargs['blackboard'],
+                                                'value')
+            received.append(value)
+            yield True
+
+        v = owyl.visit(waiter(), blackboard=bb)
+        self.assertEqual(v.next(), None)
+        self.assertEqual(v.next(), None)
+        self.assertEqual(v.waiting is not None, True)
+
+        bb['value'] = 'foo'
+        self.assertEqual(v.next(), True)
+        self.assertEqual(received, ['foo'])
+        self.assertRaises(StopIteration, v.next)
+        self.assertEqual(v.finished, True)
+
+    def testParallel_Thresholds(self):
+        """Does parallel stop as soon as a threshold policy is decided?
+        """
+        count = []
+
+        @owyl.task
+        def counted(**kwargs):
+            count.append(1)
+            yield None
+            count.append(1)
+            yield True
+
+        # Two of three must succeed; the failure doesn't decide it.
+        tree = owyl.parallel(owyl.fail(), counted(), counted(), successes=2)
+        v = owyl.visit(tree)
+        self.assertEqual(v.run_until_stall(), None)
+        self.assertEqual(v.run_until_stall(), True)
+        self.assertEqual(len(count), 4)
+
+        # Two failures fail it at once, without running the rest.
+        del count[:]
+        tree = owyl.parallel(owyl.fail(), owyl.fail(), counted(),
+                             failures=2)
+        self.assertEqual(owyl.visit(tree).run_until_stall(), False)
+        self.assertEqual(count, [])
+
+        # Success becomes impossible once two of three have failed.
+        tree = owyl.parallel(owyl.fail(), counted(), owyl.fail(),
+                             successes=2, failures=3)
+        self.assertEqual(owyl.visit(tree).run_until_stall(), False)
+        self.assertEqual(len(count), 1)
+
+    def testParallel_Retire(self):
+        """Are finished children not run again?
+        """
+        tree = owyl.parallel(owyl.succeed(), owyl.succeedAfter(after=3),
+                             policy=owyl.PARALLEL_SUCCESS.REQUIRE_ALL)
+        monitor = Profiler()
+        monitor.start()
+        v = owyl.visit(tree)
+        results = [v.run_until_stall() for x in xrange(4)]
+        monitor.stop()
+        self.assertEqual(results, [None, None, None, True])
+        self.assertEqual(monitor.stats['succeed'][0], 1)
+
+    def testUtilitySelector(self):
+        """Does the utility selector cache scores, and switch on changes?
+        """
+        bb = blackboard.Blackboard('utility', hunger=1, fear=0)
+        ran = []
+        scored = []
+
+        @owyl.task
+        def act(**kwargs):
+            ran.append(kwargs['name'])
+            while not bb['done']:
+                yield None
+                ran.append(kwargs['name'])
+            yield True
+
+        def scorer(key):
+            def score(**kwargs):
+                scored.append(key)
+                return kwargs['blackboard'][key]
+            return score
+
+        tree = owyl.utilitySelector(act(name='eat'), act(name='flee'),
+                                    scorers=[scorer('hunger'),
+                                             scorer('fear')],
+                                    watch=['fear'])
+        v = owyl.visit(tree, blackboard=bb)
+        v.run_until_stall()
+        v.run_until_stall()
+        self.assertEqual((ran, len(scored)), (['eat', 'eat'], 2))
+
+        bb['hunger'] = 5  # Not watched: no rescore.
+        v.run_until_stall()
+        self.assertEqual(len(scored), 2)
+        bb['fear'] = 9
+        v.run_until_stall()
+        self.assertEqual((ran[-1], len(scored)), ('flee', 4))
+        bb['done'] = True
+        self.assertEqual(v.run_until_stall(), True)
+        self.assertEqual(bb._watchers.get('fear'), None)
+
+        # Rescore on an interval.
+        del scored[:]
+        bb.update(done=False, hunger=0, fear=0)
+        tree = owyl.utilitySelector(act(name='eat'), act(name='flee'),
+                                    scorers=[scorer('hunger'),
+                                             scorer('fear')],
+                                    interval=2)
+        v = owyl.visit(tree, blackboard=bb)
+        for x in xrange(5):
+            v.run_until_stall()
+        self.assertEqual(len(scored), 6)
+
+    def testReactiveSelector(self):
+        """Does the reactive selector preempt for higher-priority guards?
+        """
+        bb = blackboard.Blackboard('reactive', fear=0, hunger=0)
+        ran = []
+        checks = []
+
+        @owyl.task
+        def act(**kwargs):
+            ran.append(kwargs['name'])
+            while not bb['done']:
+                yield None
+                ran.append(kwargs['name'])
+            yield kwargs.get('result', True)
+
+        def above(limit):
+            def check(value):
+                checks.append(value)
+                return value > limit
+            return check
+
+        tree = owyl.reactiveSelector(act(name='flee'), act(name='eat'),
+                                     act(name='wander'),
+                                     guards=[('fear', above(5)),
+                                             ('hunger', above(3)),
+                                             None])
+        v = owyl.visit(tree, blackboard=bb)
+        v.run_until_stall()
+        v.run_until_stall()
+        # Guards are checked once, then cached while the board is quiet.
+        self.assertEqual((ran, len(checks)), (['wander', 'wander'], 2))
+
+        bb['hunger'] = 4
+        v.run_until_stall()
+        self.assertEqual((ran[-1], len(checks)), ('eat', 3))
+        bb['fear'] = 9
+        v.run_until_stall()
+        self.assertEqual(ran[-1], 'flee')
+        bb['fear'] = 0  # The running child's guard fails: move on.
+        v.run_until_stall()
+        self.assertEqual(ran[-1], 'eat')
+        bb['done'] = True
+        self.assertEqual(v.run_until_stall(), True)
+        self.assertEqual((bb._watchers.get('fear'),
+                          bb._watchers.get('hunger')), (None, None))
+
+        # A failing child falls through to the next, as with selector.
+        tree = owyl.reactiveSelector(act(name='eat', result=False),
+                                     act(name='wander', result=False),
+                                     guards=[('hunger', above(3)), None])
+        self.assertEqual(owyl.visit(tree, blackboard=bb).run_until_stall(),
+                         False)
+        self.assertEqual(ran[-2:], ['eat', 'wander'])
+
+        # A guard on a key that starts unset still preempts once the
+        # key is written.
+        bb = blackboard.Blackboard('reactive-unset')
+        tree = owyl.reactiveSelector(act(name='flee'), act(name='wander'),
+                                     guards=[('alarm', bool), None])
+        v = owyl.visit(tree, blackboard=bb)
+        v.run_until_stall()
+        self.assertEqual(ran[-1], 'wander')
+        bb['alarm'] = True
+        v.run_until_stall()
+        self.assertEqual(ran[-1], 'flee')
+
+        # A higher child that fails while its guard holds doesn't
+        # restart the lower one; it waits for its guard to be rewritten.
+        @owyl.task
+        def balk(**kwargs):
+            ran.append(kwargs['name'])
+            yield False
+
+        bb = blackboard.Blackboard('reactive-fail', alarm=True, done=False)
+        tree = owyl.reactiveSelector(balk(name='flee'),
+                                     act(name='wander'),
+                                     guards=[('alarm', bool), None])
+        v = owyl.visit(tree, blackboard=bb)
+        del ran[:]
+        v.run_until_stall()
+        [v.run_until_stall() for x in xrange(3)]
+        self.assertEqual(ran, ['flee', 'wander', 'wander', 'wander',
+                               'wander'])
+        bb['alarm'] = True
+        v.run_until_stall()
+        self.assertEqual(ran[-2:], ['flee', 'wander'])
+        bb['done'] = True
+        self.assertEqual(v.run_until_stall(), True)
+
+    def testTaskQueue(self):
+        """Does a task queue apply backpressure, and count results?
+        """
+        tasks = owyl.TaskQueue(maxsize=2)
+        self.assertEqual([tasks.push(owyl.succeed()),
+                          tasks.push(owyl.fail()),
+                          tasks.push(owyl.succeed())], [True, True, False])
+        self.assertEqual(tasks.full, True)
+        v = owyl.visit(owyl.queue(tasks))
+        [v.next() for x in xrange(3)]
+        self.assertEqual((len(tasks), tasks.completed, tasks.failed),
+                         (0, 1, 1))
+
+    def testParallelQueue(self):
+        """Does parallel_queue bound the tasks in flight, and retire them?
+        """
+        tasks = owyl.TaskQueue()
+        for x in xrange(3):
+            tasks.push(owyl.succeedAfter(after=1))
+        tasks.push(owyl.fail())
+        v = owyl.visit(owyl.parallel_queue(tasks, max_running=2))
+        v.next()
+        self.assertEqual((len(tasks), tasks.completed), (2, 0))
+        v.next()
+        self.assertEqual((len(tasks), tasks.completed), (2, 2))
+        v.next()
+        self.assertEqual((len(tasks), tasks.failed), (0, 1))
+        v.next()
+        self.assertEqual((tasks.completed, tasks.failed), (3, 1))
+
+        # offload's max_in_flight is passed through to the tasks.
+        seen = []
+
+        @owyl.task
+        def note(**kwargs):
+            seen.append(kwargs.get('max_in_flight'))
+            yield True
+
+        tasks.push(note())
+        tasks.push(note())
+        v = owyl.visit(owyl.parallel_queue(tasks), max_in_flight=4)
+        v.next()
+        self.assertEqual(seen, [4, 4])
+
+    def testPriorityQueue(self):
+        """Does priority_queue run urgent tasks first, and drop stale ones?
+        """
+        now = [0]
+        tasks = owyl.PriorityTaskQueue(clock=lambda: now[0])
+        ran = []
+
+        @owyl.task
+        def note(**kwargs):
+            ran.append(kwargs['name'])
+            yield True
+
+        tasks.push(note(name='later'), priority=5)
+        tasks.push(note(name='stale'), priority=1, deadline=10)
+        tasks.push(note(name='first'), priority=1)
+        tasks.push(note(name='urgent'), priority=0, deadline=20)
+        now[0] = 15
+        v = owyl.visit(owyl.priority_queue(tasks))
+        [v.next() for x in xrange(4)]
+        self.assertEqual(ran, ['urgent', 'first', 'later'])
+        self.assertEqual((len(tasks), tasks.completed, tasks.expired),
+                         (0, 3, 1))
+
+        # A task that goes stale between the truth test and the pop is
+        # still run, not popped from an empty heap.
+        for runner in (owyl.priority_queue, owyl.parallel_queue):
+            ticks = itertools.count()
+            tasks = owyl.PriorityTaskQueue(clock=ticks.next)
+            tasks.push(note(name='just in time'), deadline=0)
+            v = owyl.visit(runner(tasks))
+            [v.next() for x in xrange(3)]
+            self.assertEqual((tasks.completed, tasks.expired), (1, 0))
+
+    def testAliasTable(self):
+        """Does an alias table choose outcomes in proportion to weight?
+        """
+        rng = random.Random(1)
+        table = owyl.AliasTable([1, 0, 3])
+        counts = [0, 0, 0]
+        for x in xrange(4000):
+            counts[table.choose(rng)] += 1
+        self.assertEqual(counts[1], 0)
+        self.assert_(2.5 < counts[2] / float(counts[0]) < 3.5, counts)
+
+        table.update([0, 1, 0])
+        self.assertEqual(set(table.choose(rng) for x in xrange(50)), set([1]))
+        self.assertRaises(ValueError, owyl.AliasTable, [0, 0])
+        self.assertRaises(ValueError, owyl.AliasTable, [1, -1])
+
+    def testWeightedSelector(self):
+        """Do weighted composites try each weighted child once, at random?
+        """
+        ran = []
+
+        @owyl.task
+        def act(**kwargs):
+            ran.append(kwargs['name'])
+            yield kwargs['result']
+
+        children = [act(name=x, result=False) for x in 'abcd']
+        tree = owyl.weightedSelector(weights=[1, 2, 0, 4],
+                                     rng=random.Random(2), *children)
+        v = owyl.visit(tree)
+        self.assertEqual(v.run_until_stall(), False)
+        self.assertEqual(sorted(ran), ['a', 'b', 'd'])
+        self.assertEqual(tree.initkwargs['weights'], [1, 2, 0, 4])
+
+        del ran[:]
+        children = [act(name=x, result=True) for x in 'abc']
+        tree = owyl.weightedSequence(rng=random.Random(3), *children)
+        self.assertEqual(owyl.visit(tree).run_until_stall(), True)
+        self.assertEqual(sorted(ran), ['a', 'b', 'c'])
+
+        # A shared table can be reweighted after the tree is built.
+        del ran[:]
+        table = owyl.AliasTable([1, 1])
+        tree = owyl.weightedSelector(act(name='a', result=True),
+                                     act(name='b', result=True),
+                                     weights=table)
+        table.update([0, 1])
+        for x in xrange(5):
+            owyl.visit(tree).run_until_stall()
+        self.assertEqual(ran, ['b'] * 5)
+
     def testRepeatUntilSucceed(self):
         """Can we repeat a behavior until it succeeds?
         """
@@ -393,6 +811,1082 @@ class OwylTests(unittest.TestCase):
         self.assertEqual(result, True)
 
 
+class SchedulerTests(unittest.TestCase):
+    """Tests for the batch tree scheduler.
+    """
+    def testTick(self):
+        """Can we tick many trees at once?
+        """
+        scheduler = owyl.TreeScheduler()
+        tree = owyl.succeedAfter(after=2)
+        agents = [scheduler.add(tree) for x in xrange(10)]
+
+        stats = scheduler.tick()
+        self.assertEqual(stats.ticked, 10)
+        self.assertEqual(stats.running, 10)
+
+        scheduler.tick()
+        stats = scheduler.tick()
+        self.assertEqual(stats.running, 0)
+        # Results count once the trees terminate.
+        self.assertEqual(stats.succeeded, 0)
+        self.assertEqual([a.result for a in agents], [None] * 10)
+
+        stats = scheduler.tick()
+        self.assertEqual((stats.finished, stats.succeeded), (10, 10))
+        self.assertEqual([a.result for a in agents], [True] * 10)
+        self.assertEqual(len(scheduler), 0)
+
+        # Finished agents are no longer ticked.
+        stats = scheduler.tick()
+        self.assertEqual(stats.ticked, 0)
+
+    def testParkAndWake(self):
+        """Are parked agents skipped until they are woken?
+        """
+        scheduler = owyl.TreeScheduler()
+        tree = owyl.succeedAfter(after=2)
+        a = scheduler.add(tree)
+        b = scheduler.add(tree)
+
+        scheduler.park(a)
+        stats = scheduler.tick()
+        self.assertEqual(stats.ticked, 1)
+
+        scheduler.wake(a)
+        scheduler.tick()
+        stats = scheduler.tick()
+        self.assertEqual(stats.ticked, 2)
+
+        # Park and wake between ticks shouldn't run the agent twice.
+        scheduler.park(a)
+        scheduler.wake(a)
+        stats = scheduler.tick()
+        self.assertEqual(stats.ticked, 2)
+        # a was skipped once, so it finishes a tick behind b.
+        self.assertEqual((a.result, b.result), (None, True))
+
+    def testStatuses(self):
+        """Are only the trees' own results counted, not their leaves'?
+        """
+        scheduler = owyl.TreeScheduler()
+        agent = scheduler.add(owyl.sequence(owyl.succeed(), owyl.succeed(),
+                                            owyl.fail()))
+        totals = [0, 0]
+        while len(scheduler):
+            stats = scheduler.tick()
+            totals[0] += stats.succeeded
+            totals[1] += stats.failed
+        self.assertEqual(totals, [0, 1])
+        self.assertEqual(agent.result, False)
+
+        # Removing a finished agent does nothing.
+        scheduler.remove(agent)
+
+    def testRemove(self):
+        """Are removed and finished agents dropped from the live agents?
+        """
+        scheduler = owyl.TreeScheduler(until_stall=True)
+        agents = [scheduler.add(owyl.succeedAfter(after=x))
+                  for x in xrange(6)]
+        scheduler.remove(agents[4])
+        scheduler.remove(agents[0])
+        scheduler.tick()
+        stats = scheduler.tick()
+        self.assertEqual((stats.finished, scheduler.finished),
+                         (1, [agents[1]]))
+        self.assertEqual(set(scheduler), set([agents[2], agents[3],
+                                              agents[5]]))
+        self.assertEqual(sorted(scheduler.agents[a.index] is a
+                                for a in scheduler), [True] * 3)
+        self.assertEqual(scheduler.run(), 4)
+        self.assertEqual((len(scheduler), scheduler.finished),
+                         (0, [agents[5]]))
+
+    def testRun(self):
+        """Can we run the scheduler until all trees finish?
+        """
+        scheduler = owyl.TreeScheduler()
+        scheduler.add(owyl.sequence(owyl.succeed(), owyl.fail()))
+        scheduler.add(owyl.succeedAfter(after=5))
+        self.assertEqual(scheduler.run(), 7)
+        self.assertEqual(len(scheduler), 0)
+
+    def testUntilStall(self):
+        """Are agents finished on the tick their tree terminates?
+        """
+        scheduler = owyl.TreeScheduler(until_stall=True)
+        tree = owyl.sequence(owyl.succeed(), owyl.succeedAfter(after=1))
+        a = scheduler.add(tree)
+        b = scheduler.add(owyl.sequence(owyl.succeed(), owyl.fail()))
+
+        stats = scheduler.tick()
+        self.assertEqual((stats.running, stats.failed, stats.finished),
+                         (1, 1, 1))
+        self.assertEqual(b.result, False)
+
+        stats = scheduler.tick()
+        self.assertEqual((stats.ticked, stats.succeeded, stats.finished),
+                         (1, 1, 1))
+        self.assertEqual(a.result, True)
+        self.assertEqual(len(scheduler), 0)
+
+    def testWaitBB(self):
+        """Are agents waiting on the blackboard parked until a write?
+        """
+        bb = blackboard.Blackboard('test', )  # 'value' defaults to None.
+        scheduler = owyl.TreeScheduler()
+        tree = owyl.sequence(blackboard.waitBB(key='value',
+                                               check=lambda x: x == 'foo'),
+                             owyl.succeed())
+        agent = scheduler.add(tree, blackboard=bb)
+
+        self.assertEqual(scheduler.tick().ticked, 1)
+        self.assertEqual(agent.parked, True)
+        self.assertEqual(scheduler.tick().ticked, 0)
+
+        # A write that doesn't pass the check parks the agent again.
+        bb['value'] = 'bar'
+        self.assertEqual(scheduler.tick().ticked, 1)
+        self.assertEqual(scheduler.tick().ticked, 0)
+
+        bb['value'] = 'foo'
+        scheduler.run()
+        self.assertEqual(agent.finished, True)
+        self.assertEqual(agent.result, True)
+
+
+class NodeTests(unittest.TestCase):
+    """Tests for the explicit-state node engine.
+
+    Note: as with the core engine, tests should run the tree twice to
+    make sure that the constructed tree is re-usable.
+    """
+    def testSequence(self):
+        """Do sequences succeed and fail like the core sequence?
+        """
+        tree = nodes.sequence(nodes.succeed(),
+                              nodes.succeedAfter(after=2),
+                              nodes.succeed())
+        root = tree()
+        for x in xrange(2):
+            self.assertEqual(root.tick(), nodes.RUNNING)
+            self.assertEqual(root.tick(), nodes.RUNNING)
+            self.assertEqual(root.tick(), nodes.SUCCESS)
+
+        tree = nodes.sequence(nodes.succeed(),
+                              nodes.fail(),
+                              nodes.succeed())
+        root = tree()
+        self.assertEqual(root.tick(), nodes.FAILURE)
+        self.assertEqual(root.tick(), nodes.FAILURE)
+
+    def testSelector(self):
+        """Do selectors succeed and fail like the core selector?
+        """
+        tree = nodes.selector(nodes.fail(),
+                              nodes.failAfter(after=1),
+                              nodes.succeed())
+        root = tree()
+        for x in xrange(2):
+            self.assertEqual(root.tick(), nodes.RUNNING)
+            self.assertEqual(root.tick(), nodes.SUCCESS)
+
+        root = nodes.selector(nodes.fail(), nodes.fail())()
+        self.assertEqual(root.tick(), nodes.FAILURE)
+
+    def testParallel(self):
+        """Does parallel honor its success policy?
+        """
+        tree = nodes.parallel(nodes.succeedAfter(after=1),
+                              nodes.succeedAfter(after=3),
+                              policy=owyl.PARALLEL_SUCCESS.REQUIRE_ALL)
+        root = tree()
+        for x in xrange(2):
+            results = [root.tick() for y in xrange(4)]
+            self.assertEqual(results, [None, None, None, True])
+
+        tree = nodes.parallel(nodes.succeedAfter(after=1),
+                              nodes.failAfter(after=3),
+                              policy=owyl.PARALLEL_SUCCESS.REQUIRE_ONE)
+        root = tree()
+        self.assertEqual([root.tick(), root.tick()], [None, True])
+
+        tree = nodes.parallel(nodes.fail(),
+                              nodes.succeedAfter(after=3),
+                              policy=owyl.PARALLEL_SUCCESS.REQUIRE_ALL)
+        self.assertEqual(tree().tick(), False)
+
+        # Thresholds, as with the core parallel; they aren't passed on.
+        tree = nodes.parallel(nodes.fail(), nodes.succeedAfter(after=1),
+                              nodes.succeedAfter(after=1), successes=2)
+        root = tree()
+        self.assertEqual(root.children[1].kwargs.get('successes'), None)
+        for x in xrange(2):
+            self.assertEqual([root.tick(), root.tick()], [None, True])
+        tree = nodes.parallel(nodes.fail(), nodes.succeedAfter(after=1),
+                              nodes.fail(), successes=2, failures=3)
+        self.assertEqual(tree().tick(), False)
+
+    def testDecorators(self):
+        """Do the decorators behave like their core counterparts?
+        """
+        root = nodes.flip(nodes.succeedAfter(after=1))()
+        self.assertEqual([root.tick(), root.tick()], [None, False])
+
+        root = nodes.identity(nodes.fail())()
+        self.assertEqual(root.tick(), False)
+
+        bb = blackboard.Blackboard('test', value='foo')
+        root = nodes.repeatUntilFail(nodes.checkBB(key='value'),
+                                     final_value=True)(blackboard=bb)
+        self.assertEqual(root.tick(), None)
+        self.assertEqual(root.tick(), None)
+        bb['value'] = None
+        self.assertEqual(root.tick(), True)
+
+    def testBlackboard(self):
+        """Can nodes set and check values on a blackboard?
+        """
+        value = 'foo'
+        checker = lambda x: x == value
+
+        bb = blackboard.Blackboard('test', value='bar')
+        tree = nodes.sequence(nodes.setBB(key="value", value=value),
+                              nodes.checkBB(key='value', check=checker))
+        self.assertEqual(tree(blackboard=bb).tick(), True)
+        self.assertEqual(bb['value'], value)
+
+    def testTaskChildren(self):
+        """Can core tasks be used as children of nodes?
+        """
+        tree = nodes.sequence(owyl.succeedAfter(after=1),
+                              owyl.sequence(owyl.succeed(), owyl.fail()))
+        root = tree()
+        for x in xrange(2):
+            self.assertEqual(root.tick(), None)
+            self.assertEqual(root.tick(), False)
+
+    def testVisitNodes(self):
+        """Can node trees be visited by the core engine?
+        """
+        tree = owyl.sequence(owyl.succeed(),
+                             nodes.sequence(nodes.succeedAfter(after=1),
+                                            nodes.succeed()))
+        for x in xrange(2):
+            v = owyl.visit(tree)
+            self.assertEqual([x for x in v], [True, None, True, True])
+
+    def testSchedulerNodes(self):
+        """Can the scheduler tick node trees directly?
+        """
+        scheduler = owyl.TreeScheduler()
+        agent = scheduler.add(nodes.succeedAfter(after=2))
+        self.assertEqual(scheduler.run(), 4)
+        self.assertEqual(agent.result, True)
+
+
+class PoolTests(unittest.TestCase):
+    """Tests for recycling tree instances.
+    """
+    def testVisitorPool(self):
+        """Are recycled visitors restarted with new keyword arguments?
+        """
+        tree = owyl.sequence(blackboard.setBB(key='value', value='foo'),
+                             owyl.succeedAfter(after=1))
+        pool = TreePool(tree, maxsize=1)
+
+        bb1 = blackboard.Blackboard('pool1', )
+        v = pool.acquire(blackboard=bb1)
+        self.assertEqual(v.run_until_stall(), None)
+        pool.release(v)
+
+        bb2 = blackboard.Blackboard('pool2', )
+        self.assertEqual(pool.acquire(blackboard=bb2) is v, True)
+        self.assertEqual([x for x in v], [True, None, True, True])
+        self.assertEqual(bb2['value'], 'foo')
+        self.assertEqual((pool.created, pool.reused), (1, 1))
+
+        pool.release(v)
+        pool.release(owyl.visit(tree))  # Beyond maxsize; discarded.
+        self.assertEqual(len(pool), 1)
+
+    def testNodePool(self):
+        """Are recycled node trees reset and re-bound in place?
+        """
+        tree = nodes.sequence(nodes.succeedAfter(after=1),
+                              nodes.setBB(key='value', value='foo'))
+        pool = TreePool(tree)
+
+        bb1 = blackboard.Blackboard('pool1', )
+        root = pool.acquire(blackboard=bb1)
+        self.assertEqual(root.tick(), None)
+        pool.release(root)
+
+        bb2 = blackboard.Blackboard('pool2', )
+        self.assertEqual(pool.acquire(blackboard=bb2) is root, True)
+        self.assertEqual([root.tick(), root.tick()], [None, True])
+        self.assertEqual((bb1['value'], bb2['value']), (None, 'foo'))
+
+
+class ProfilerTests(unittest.TestCase):
+    """Tests for per-node profiling.
+    """
+    def tearDown(self):
+        owyl.setMonitor(None)
+
+    def testProfiler(self):
+        """Are calls and yields counted per node, across visitors?
+        """
+        tree = owyl.sequence(owyl.succeedAfter(after=2),
+                             owyl.selector(owyl.fail(), owyl.succeed()),
+                             owyl.parallel(owyl.succeed()))
+        profiler = Profiler()
+        profiler.start()
+        for x in xrange(2):
+            [x for x in owyl.visit(tree)]
+        profiler.stop()
+
+        stats = profiler.stats
+        # [calls, total, own, succeeded, failed, stalled]
+        self.assertEqual(stats['sequence'][:1] + stats['sequence'][3:],
+                         [2, 2, 0, 0])
+        self.assertEqual(stats['succeedAfter'][:1] + stats['succeedAfter'][3:],
+                         [2, 2, 0, 4])
+        self.assertEqual(stats['fail'][:1] + stats['fail'][3:],
+                         [2, 0, 2, 0])
+        self.assertEqual(stats['selector'][3], 2)
+        # The parallel's child visitor is profiled too.
+        self.assertEqual(stats['succeed'][0], 4)
+        for calls, total, own, succeeded, failed, stalled in stats.values():
+            self.assertEqual(total >= own >= 0, True)
+
+        table = profiler.table(sort='calls')
+        self.assertEqual(table.splitlines()[0].split()[:3],
+                         ['node', 'calls', 'total'])
+
+        # Visitors created after stopping aren't instrumented.
+        profiler.clear()
+        [x for x in owyl.visit(tree)]
+        self.assertEqual(profiler.stats, {})
+
+
+class TracerTests(unittest.TestCase):
+    """Tests for ring-buffer execution traces.
+    """
+    def tearDown(self):
+        owyl.setMonitor(None)
+
+    def testSampling(self):
+        """Is one in N agents traced, nested visitors included?
+        """
+        tree = owyl.sequence(owyl.succeed(), owyl.parallel(owyl.succeed()))
+        tracer = Tracer(sample=2)
+        tracer.start()
+        for x in xrange(4):
+            [x for x in owyl.visit(tree)]
+        tracer.stop()
+
+        self.assertEqual(len(tracer.buffers), 2)
+        labels = dict((nid, name) for name, nid in tracer.names.items())
+        records = tracer.buffers[0].records()
+        self.assertEqual([(kind, labels[nid]) for kind, nid, r, t in records],
+                         [(ENTER, 'sequence'), (ENTER, 'succeed'),
+                          (EXIT, 'succeed'), (ENTER, 'parallel'),
+                          (ENTER, 'succeed'), (EXIT, 'succeed'),
+                          (EXIT, 'parallel'), (EXIT, 'sequence')])
+        self.assertEqual(records[-1][2], True)
+
+    def testRingBuffer(self):
+        """Are only the latest records kept, and exported as matched events?
+        """
+        tree = owyl.sequence(owyl.succeed(), owyl.succeed())
+        tracer = Tracer(capacity=4)
+        tracer.start()
+        [x for x in owyl.visit(tree)]
+        tracer.stop()
+
+        buf = tracer.buffers[0]
+        self.assertEqual(buf.count, 6)
+        self.assertEqual([kind for kind, nid, r, t in buf.records()],
+                         [EXIT, ENTER, EXIT, EXIT])
+        events = tracer.chromeTrace()['traceEvents']
+        # The exits whose entries were overwritten are dropped.
+        self.assertEqual([(e['ph'], e['name']) for e in events],
+                         [('B', 'succeed'), ('E', 'succeed')])
+        self.assertEqual(events[1]['args'], {'result': True})
+
+    def testNestedLanes(self):
+        """Do nested visitors get their own thread ids, so that children
+        finishing out of order still nest properly?
+        """
+        tree = owyl.parallel(owyl.succeedAfter(after=1),
+                             owyl.failAfter(after=3),
+                             policy=owyl.PARALLEL_SUCCESS.REQUIRE_ALL)
+        tracer = Tracer()
+        tracer.start()
+        [x for x in owyl.visit(tree)]
+        tracer.stop()
+
+        self.assertEqual(len(tracer.buffers), 1)
+        events = tracer.chromeTrace()['traceEvents']
+        self.assertEqual(len(set(e['tid'] for e in events)), 3)
+        lanes = {}
+        for e in events:
+            slices = lanes.setdefault(e['tid'], [])
+            if e['ph'] == 'B':
+                slices.append(e['name'])
+            else:
+                self.assertEqual(slices.pop(), e['name'])
+        self.assertEqual(len(events), 6)
+
+        # Thread ids are reused once their visitor is done with them.
+        tree = owyl.repeatAlways(
+            owyl.parallel(owyl.succeedAfter(after=1),
+                          owyl.succeedAfter(after=2),
+                          policy=owyl.PARALLEL_SUCCESS.REQUIRE_ALL))
+        tracer = Tracer()
+        tracer.start()
+        v = owyl.visit(tree)
+        [v.next() for x in xrange(50)]
+        tracer.stop()
+        buf = tracer.buffers[0]
+        self.assertEqual(set(buf.tids[i] for i in buf._order()),
+                         set([0, 1, 2, 3]))
+
+
+class SamplerTests(unittest.TestCase):
+    """Tests for the tree-path sampling profiler.
+    """
+    def tearDown(self):
+        owyl.setMonitor(None)
+
+    def testSample(self):
+        """Are leaf visitors counted by tree path, through nested visitors?
+        """
+        tree = owyl.sequence(owyl.succeed(),
+                             owyl.parallel(owyl.succeedAfter(after=10)))
+        sampler = Sampler()
+        sampler.install()
+        v = owyl.visit(tree)
+        v.advance(steps=4)
+        sampler.uninstall()
+        sampler.sample()
+        sampler.sample()
+        self.assertEqual(sampler.folded(),
+                         'sequence;parallel;succeedAfter 2')
+
+        [x for x in v]
+        sampler.clear()
+        sampler.sample()
+        self.assertEqual((sampler.counts, sampler.samples), ({}, 1))
+
+        # Visitors nested two deep find their own parent, not the root.
+        tree = owyl.parallel(owyl.parallel(owyl.succeedAfter(after=10)))
+        sampler.install()
+        v = owyl.visit(tree)
+        v.next()
+        sampler.uninstall()
+        sampler.sample()
+        self.assertEqual(sampler.folded(),
+                         'parallel;parallel;succeedAfter 1')
+
+
+class BenchTests(unittest.TestCase):
+    """Tests for the microbenchmarks.
+    """
+    def testRun(self):
+        """Does every benchmark run, and report positive rates?
+        """
+        for name, func in bench.BENCHMARKS:
+            ticks, ns = bench.run(name, depth=2, width=3, number=2, repeat=1)
+            self.assertEqual(ticks > 0 and ns > 0, True)
+
+
+class OptimizeTests(unittest.TestCase):
+    """Tests for the static tree optimizer.
+    """
+    def testRewrites(self):
+        """Are removable nodes taken out, with the same results?
+        """
+        leaf = owyl.succeedAfter(after=1)
+        tree = owyl.sequence(owyl.identity(leaf),
+                             owyl.succeed(),
+                             owyl.sequence(owyl.flip(owyl.flip(owyl.fail())),
+                                           leaf),
+                             owyl.selector(owyl.fail(), leaf))
+        small = optimize(tree)
+        self.assertEqual(size(tree), 12)
+        self.assertEqual(size(small), 5)
+        self.assertEqual(small.children, (leaf, small.children[1], leaf, leaf))
+        self.assertEqual(small.children[1].__name__, 'fail')
+        self.assertEqual([x for x in owyl.visit(tree) if x is not None][-1],
+                         [x for x in owyl.visit(small)
+                          if x is not None][-1])
+
+    def testKeywords(self):
+        """Are nodes built with keyword arguments and unchanged subtrees kept?
+        """
+        inner = owyl.sequence(owyl.succeed(), owyl.fail(), key='value')
+        kept = owyl.identity(inner, key='value')
+        tree = owyl.selector(kept,
+                             owyl.parallel(owyl.sequence(owyl.succeed(),
+                                                         owyl.fail())))
+        self.assertEqual(optimize(kept) is kept, True)
+        small = optimize(tree)
+        self.assertEqual(small.children[0] is kept, True)
+        self.assertEqual(small.children[1].__name__, 'parallel')
+        self.assertEqual(small.children[1].children[0].__name__, 'fail')
+
+
+class Walker(object):
+    """An agent whose tree is shared by all walkers.
+    """
+    def __init__(self):
+        self.steps = 0
+
+    @owyl.agentmethod
+    def walk(self, **kwargs):
+        self.steps += kwargs['stride']
+        yield True
+
+    @classmethod
+    @shared
+    def buildTree(cls):
+        return owyl.sequence(cls.walk(stride=1), owyl.identity(cls.walk()))
+
+
+class FlyweightTests(unittest.TestCase):
+    """Tests for agent methods and shared tree definitions.
+    """
+    def testSharedTree(self):
+        """Is the tree built once, and run for each agent?
+        """
+        self.assertEqual(Walker.buildTree() is Walker().buildTree(), True)
+        flyweight = Flyweight(Walker.buildTree(), optimize=True)
+        walkers = [Walker(), Walker()]
+        for walker, stride in zip(walkers, (2, 3)):
+            visitor = flyweight.instantiate(agent=walker, stride=stride)
+            self.assertEqual([x for x in visitor], [True, True, True])
+        self.assertEqual([w.steps for w in walkers], [3, 4])
+        self.assertEqual(flyweight.instances, 2)
+
+    def testNodes(self):
+        """Can owyl.nodes trees be shared too?
+        """
+        flyweight = Flyweight(nodes.sequence(Walker.walk(stride=1)))
+        walker = Walker()
+        root = flyweight.instantiate(agent=walker)
+        self.assertEqual(root.tick(), True)
+        self.assertEqual(walker.steps, 1)
+
+
+def isPositive(value):
+    return value > 0
+
+
+class SerializeTests(unittest.TestCase):
+    """Tests for the task registry and binary tree format.
+    """
+    def setUp(self):
+        self.registry = registry.Registry(parent=registry.default)
+        self.registry.register(isPositive)
+        self.registry.register(ValueError)
+        serialize.clearCache()
+
+    def testRoundTrip(self):
+        """Is a tree loaded back with the same structure and behavior?
+        """
+        shared = owyl.sequence(owyl.succeed(), owyl.log('hi', name='x'))
+        tree = owyl.selector(
+            blackboard.checkBB(key='hp', check=isPositive),
+            owyl.catch(owyl.throw(throws=ValueError), caught=ValueError,
+                       branch=shared),
+            shared,
+            owyl.parallel(owyl.succeedAfter(after=2),
+                          policy=owyl.PARALLEL_SUCCESS.REQUIRE_ALL),
+            owyl.setBB(key=u'caf\xe9', value=[1, 2.5, (None, 10**20)]))
+        data = serialize.dumps(tree, self.registry)
+        self.assertEqual(data[:5], 'OWYL\x01')
+        loaded = serialize.loads(data, self.registry)
+        self.assertEqual(serialize.dumps(loaded, self.registry), data)
+        self.assertEqual(loaded.children[1].initkwargs['branch']
+                         is loaded.children[2], True)
+        self.assertEqual(loaded.children[4].initkwargs['value'],
+                         [1, 2.5, (None, 10**20)])
+
+        bb = blackboard.Blackboard('serialize', hp=0)
+        self.assertEqual([x for x in owyl.visit(loaded, blackboard=bb)],
+                         [x for x in owyl.visit(tree, blackboard=bb)])
+
+    def testErrors(self):
+        """Are unregistered tasks and bad data reported?
+        """
+        self.assertRaises(serialize.SerializeError, serialize.dumps,
+                          blackboard.checkBB(key='hp', check=isPositive))
+        self.assertRaises(serialize.SerializeError, serialize.dumps,
+                          owyl.wrap(isPositive, 1)())
+        data = serialize.dumps(owyl.sequence(owyl.succeed()))
+        self.assertRaises(serialize.SerializeError, serialize.loads,
+                          data[:-3])
+        self.assertRaises(serialize.SerializeError, serialize.loads,
+                          'JUNK' + data[4:])
+
+    def testCache(self):
+        """Is loading the same data again only a lookup?
+        """
+        data = serialize.dumps(owyl.sequence(owyl.succeed()))
+        tree = serialize.loads(data)
+        self.assertEqual(serialize.loads(data) is tree, True)
+        self.assertEqual(serialize.loads(data, self.registry) is tree, False)
+        serialize.clearCache()
+        self.assertEqual(serialize.loads(data) is tree, False)
+
+
+class DSLTests(unittest.TestCase):
+    """Tests for compiling trees from data.
+    """
+    def setUp(self):
+        self.registry = registry.Registry(parent=registry.default)
+        self.registry.register(isPositive)
+        dsl.clearCache()
+
+    def testCompile(self):
+        """Are nodes, children, keywords, references and subtrees compiled?
+        """
+        data = {'selector': [
+            {'sequence': [{'checkBB': {'key': 'hp', 'check': '$isPositive'}},
+                          {'setBB': {'key': 'state', 'value': '$$5'}}]},
+            {'catch': {'caught': '$ValueError',
+                       'branch': {'$tree': 'succeed'},
+                       'children': [{'throw': {'throws': '$ValueError'}}]}},
+            'fail']}
+        self.registry.register(ValueError)
+        tree = dsl.compile(data, self.registry)
+        self.assertEqual(tree.__name__, 'selector')
+        check = tree.children[0].children[0]
+        self.assertEqual(check.initkwargs['check'] is isPositive, True)
+        self.assertEqual(tree.children[1].initkwargs['branch'].__name__,
+                         'succeed')
+
+        bb = blackboard.Blackboard('dsl', hp=1)
+        self.assertEqual([x for x in owyl.visit(tree, blackboard=bb)][-1],
+                         True)
+        self.assertEqual(bb['state'], '$5')
+        bb['hp'] = 0
+        self.assertEqual([x for x in owyl.visit(tree, blackboard=bb)][-1],
+                         True)
+
+        self.assertRaises(dsl.DSLError, dsl.compile, {'sequence': ['nope']})
+        self.assertRaises(dsl.DSLError, dsl.compile, {'a': 1, 'b': 2})
+        self.assertRaises(dsl.DSLError, dsl.compile,
+                          {'checkBB': {'check': '$nope'}})
+
+    def testCache(self):
+        """Are loaded trees cached by content, and files reloaded on change?
+        """
+        text = '{"sequence": ["succeed", {"log": "hello"}]}'
+        tree = dsl.loads(text)
+        self.assertEqual(dsl.loads(text) is tree, True)
+        self.assertEqual(dsl.loads(text + ' ') is tree, False)
+
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, text)
+            os.close(fd)
+            self.assertEqual(dsl.loadFile(path) is tree, True)
+            self.assertEqual(dsl.loadFile(path) is tree, True)
+            stream = open(path, 'w')
+            stream.write('"fail"')
+            stream.close()
+            self.assertEqual(dsl.loadFile(path).__name__, 'fail')
+            # The old revision is no longer cached.
+            self.assertEqual(dsl.loads(text) is tree, False)
+        finally:
+            os.remove(path)
+
+    def testCacheSize(self):
+        """Is the cache bounded, dropping the least recently used trees?
+        """
+        size = dsl.CACHE_SIZE
+        try:
+            dsl.CACHE_SIZE = 2
+            first = dsl.loads('"succeed"')
+            dsl.loads('"fail"')
+            self.assertEqual(dsl.loads('"succeed"') is first, True)
+            dsl.loads('"stall"')  # Drops "fail", the least recent.
+            self.assertEqual(len(dsl._cache), 2)
+            self.assertEqual(dsl.loads('"succeed"') is first, True)
+        finally:
+            dsl.CACHE_SIZE = size
+
+    @unittest.skipIf(dsl.yaml is None, "PyYAML isn't installed")
+    def testYAML(self):
+        """Are trees loaded from YAML?
+        """
+        text = """
+selector:
+  - sequence:
+      - checkBB: {key: hp, check: $isPositive}
+      - setBB: {key: state, value: fighting}
+  - parallel:
+      policy: ALL
+      children:
+        - succeed
+        - log: "Nothing to do."
+"""
+        tree = dsl.loads(text, self.registry)
+        self.assertEqual(tree.__name__, 'selector')
+        self.assertEqual(tree.children[1].initkwargs, {'policy': 'ALL'})
+        bb = blackboard.Blackboard('dsl-yaml', hp=1)
+        self.assertEqual(owyl.visit(tree, blackboard=bb).run_until_stall(),
+                         True)
+        self.assertEqual(bb['state'], 'fighting')
+
+
+@owyl.parent_task
+def guarded(child, **kwargs):
+    """Run the child, noting in C{closed} when this task is halted.
+    """
+    try:
+        result = yield child(**kwargs)
+    finally:
+        kwargs['closed'].append(kwargs.get('name'))
+    yield result
+
+
+class CloseTests(unittest.TestCase):
+    """Tests for halting abandoned subtrees.
+    """
+    def testClose(self):
+        """Does closing a visitor close its running iterators, innermost
+        first?
+        """
+        closed = []
+        tree = guarded(guarded(owyl.succeedAfter(after=5), name='inner'),
+                       name='outer')
+        v = owyl.visit(tree, closed=closed)
+        self.assertEqual(v.run_until_stall(), None)
+        v.close()
+        self.assertEqual(closed, ['inner', 'outer'])
+        self.assertEqual(v.finished, True)
+        self.assertRaises(StopIteration, v.next)
+        v.close()  # Closing again does nothing.
+        self.assertEqual(len(closed), 2)
+
+        v.reset(closed=closed)
+        self.assertEqual(v.run_until_stall(), None)
+        v.reset(closed=closed)
+        self.assertEqual(len(closed), 4)
+
+    def testParallel(self):
+        """Does parallel halt the children still running when it's done?
+        """
+        closed = []
+        tree = owyl.parallel(guarded(owyl.succeedAfter(after=5),
+                                     name='slow'),
+                             guarded(owyl.succeedAfter(after=1),
+                                     name='fast'),
+                             policy=owyl.PARALLEL_SUCCESS.REQUIRE_ONE)
+        v = owyl.visit(tree, closed=closed)
+        self.assertEqual(v.run_until_stall(), None)
+        self.assertEqual(v.run_until_stall(), True)
+        self.assertEqual(closed, ['fast', 'slow'])
+
+    def testCatch(self):
+        """Does catch halt the child's parents before the branch runs?
+        """
+        closed = []
+        tree = owyl.catch(guarded(owyl.throw(throws=ValueError),
+                                  name='thrower'),
+                          caught=ValueError,
+                          branch=owyl.succeed())
+        v = owyl.visit(tree, closed=closed)
+        self.assertEqual(v.run_until_stall(), True)
+        self.assertEqual(closed, ['thrower'])
+
+    def testPreempt(self):
+        """Does a reactive selector halt the child it preempts?
+        """
+        closed = []
+        bb = blackboard.Blackboard('close', alarm=False)
+        tree = owyl.reactiveSelector(
+            guarded(owyl.succeed(), name='flee'),
+            guarded(owyl.succeedAfter(after=5), name='wander'),
+            guards=[('alarm', bool), None])
+        v = owyl.visit(tree, blackboard=bb, closed=closed)
+        self.assertEqual(v.run_until_stall(), None)
+        bb['alarm'] = True
+        self.assertEqual(v.run_until_stall(), True)
+        # The higher child runs first; the preempted one is halted once
+        # it has not failed.
+        self.assertEqual(closed, ['flee', 'wander'])
+
+    def testSchedulerRemove(self):
+        """Does removing an agent halt its tree?
+        """
+        closed = []
+        scheduler = owyl.TreeScheduler()
+        agent = scheduler.add(guarded(owyl.succeedAfter(after=5)),
+                              closed=closed)
+        scheduler.tick()
+        scheduler.remove(agent)
+        self.assertEqual(closed, [None])
+
+        # An agent may remove itself from inside its own tree.
+        @owyl.task
+        def despawn(**kwargs):
+            scheduler.remove(agents[0])
+            yield True
+
+        del closed[:]
+        agents = []
+        tree = guarded(owyl.sequence(owyl.succeed(), despawn()))
+        agents.append(scheduler.add(tree, closed=closed))
+        scheduler.tick()
+        self.assertEqual(closed, [])
+        stats = scheduler.tick()
+        self.assertEqual((closed, stats.finished, len(scheduler)),
+                         ([None], 0, 0))
+        self.assertEqual(agents[0].finished, True)
+
+
+class Future(object):
+    """A minimal future, standing in for asyncio's.
+    """
+    def __init__(self):
+        self.callbacks = []
+        self._done = False
+        self._result = None
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        return self._result
+
+    def add_done_callback(self, callback):
+        if self._done:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def set_result(self, result):
+        self._result = result
+        self._done = True
+        for callback in self.callbacks:
+            callback(self)
+
+    def cancel(self):
+        if self._done:
+            return False
+        self.cancelled = True
+        self.set_result(None)
+        return True
+
+
+class Loop(object):
+    """A minimal event loop, standing in for asyncio's.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def call_soon(self, callback):
+        self.calls.append(callback)
+
+    call_later = lambda self, delay, callback: self.call_soon(callback)
+
+    def runOnce(self):
+        calls, self.calls = self.calls, []
+        for callback in calls:
+            callback()
+        return len(calls)
+
+
+class Executor(object):
+    """A minimal executor, standing in for concurrent.futures'.
+
+    Calls are run when their future is completed with L{finish}.
+    """
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self.pending.append((future, func, args, kwargs))
+        return future
+
+    def finish(self):
+        future, func, args, kwargs = self.pending.pop(0)
+        future.set_result(func(*args, **kwargs))
+
+
+class AsyncTests(unittest.TestCase):
+    """Tests for asynchronous tasks and the event loop runner.
+    """
+    def testAsyncTask(self):
+        """Does an async task wait on its future?
+        """
+        futures = []
+
+        @owyl.async_task
+        def fetch(**kwargs):
+            futures.append(Future())
+            return futures[-1]
+
+        tree = owyl.sequence(fetch(), owyl.succeed())
+        v = owyl.visit(tree)
+        self.assertEqual(v.run_until_stall(), None)
+        self.assertEqual(v.run_until_stall(), None)
+
+        futures[0].set_result('data')
+        self.assertEqual(v.run_until_stall(), True)
+
+        v = owyl.visit(tree)
+        self.assertEqual(v.run_until_stall(), None)
+        futures[1].set_result(None)
+        self.assertEqual(v.run_until_stall(), False)
+
+    def testLoopRunner(self):
+        """Does the runner idle while all agents wait on futures?
+        """
+        futures = []
+
+        @owyl.async_task
+        def fetch(**kwargs):
+            futures.append(Future())
+            return futures[-1]
+
+        loop = Loop()
+        scheduler = owyl.TreeScheduler(until_stall=True)
+        agents = [scheduler.add(fetch()) for x in xrange(3)]
+        runner = LoopRunner(scheduler, loop)
+        runner.start()
+
+        self.assertEqual(loop.runOnce(), 1)
+        self.assertEqual(runner.stats.running, 3)
+
+        # Every agent is parked, so nothing more is scheduled.
+        self.assertEqual(loop.runOnce(), 0)
+
+        futures[1].set_result(True)
+        self.assertEqual(loop.runOnce(), 1)
+        self.assertEqual(runner.stats.ticked, 1)
+        self.assertEqual(agents[1].result, True)
+        self.assertEqual(loop.runOnce(), 0)
+
+        runner.stop()
+        futures[0].set_result(True)
+        self.assertEqual(loop.runOnce(), 0)
+
+    def testOffload(self):
+        """Are offloaded calls run on the executor?
+        """
+        executor = Executor()
+        tree = owyl.sequence(owyl.offload(lambda x: x > 1, 2)(),
+                             owyl.offload(lambda x: x > 1, 0)())
+        v = owyl.visit(tree, executor=executor)
+        self.assertEqual(v.run_until_stall(), None)
+        self.assertEqual(len(executor.pending), 1)
+        self.assertEqual(v.run_until_stall(), None)
+
+        executor.finish()
+        self.assertEqual(v.run_until_stall(), None)
+        executor.finish()
+        self.assertEqual(v.run_until_stall(), False)
+
+    def testOffloadInFlight(self):
+        """Is the number of calls in flight on an executor bounded?
+        """
+        executor = Executor()
+        scheduler = owyl.TreeScheduler(until_stall=True)
+        tree = owyl.offload(lambda: True)(max_in_flight=2)
+        agents = [scheduler.add(tree, executor=executor)
+                  for x in xrange(3)]
+
+        scheduler.tick()
+        self.assertEqual(len(executor.pending), 2)
+        self.assertEqual(scheduler.tick().ticked, 1)
+        self.assertEqual(len(executor.pending), 2)
+
+        executor.finish()
+        scheduler.tick()
+        self.assertEqual(len(executor.pending), 2)
+        executor.finish()
+        executor.finish()
+        scheduler.run()
+        self.assertEqual([a.result for a in agents], [True] * 3)
+
+    def testOffloadCancel(self):
+        """Is an offloaded call cancelled when its task is closed?
+        """
+        executor = Executor()
+        tree = owyl.offload(lambda: True)(max_in_flight=1)
+        v = owyl.visit(tree, executor=executor)
+        self.assertEqual(v.run_until_stall(), None)
+        future = executor.pending[0][0]
+        v.close()
+        self.assertEqual(getattr(future, 'cancelled', False), True)
+
+        # The cancelled call no longer counts against the limit.
+        v = owyl.visit(tree, executor=executor)
+        v.run_until_stall()
+        self.assertEqual(len(executor.pending), 2)
+
+
+def buildShardTree(value):
+    """Build a tree for the sharding tests.
+    """
+    return owyl.sequence(blackboard.waitBB(key='go'),
+                         blackboard.setBB(key='done', value=value))
+
+
+def buildBrokenTree():
+    """Build a tree that raises in its worker.
+    """
+    return owyl.throw(throws=ValueError, throws_message="AUGH!!")
+
+
+class ShardingTests(unittest.TestCase):
+    """Tests for the sharded runner.
+    """
+    def setUp(self):
+        self.runner = ShardedRunner(processes=2, until_stall=True)
+
+    def tearDown(self):
+        self.runner.close()
+
+    def testShardedTick(self):
+        """Are agents ticked in workers, exchanging blackboard updates?
+        """
+        runner = self.runner
+        aids = [runner.add(buildShardTree, {'go': None}, x)
+                for x in xrange(5)]
+
+        stats = runner.tick()
+        self.assertEqual((stats.ticked, stats.running), (5, 5))
+        self.assertEqual(runner.tick().ticked, 0)  # All are waiting.
+
+        runner.post(aids[0], 'go', True)
+        stats = runner.tick()
+        self.assertEqual((stats.ticked, stats.succeeded), (1, 1))
+        self.assertEqual(runner.blackboard(aids[0])['done'], 0)
+        self.assertEqual(runner.results, {aids[0]: True})
+
+        runner.broadcast('go', True)
+        stats = runner.tick()
+        self.assertEqual(stats.succeeded, 4)
+        self.assertEqual([runner.blackboard(aid)['done'] for aid in aids],
+                         range(5))
+        self.assertEqual(len(runner), 0)
+
+    def testShardError(self):
+        """Are exceptions in workers raised in the host?
+        """
+        self.runner.add(buildBrokenTree)
+        self.assertRaises(ShardError, self.runner.tick)
+
+
 if __name__ == "__main__":
     runner = unittest
     try: